@@ -0,0 +1,269 @@
+"""Admission control of expensive requests from an estimate of the rows they read."""
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+from urllib.parse import parse_qsl, urlencode
+from time import perf_counter
+from typing import Any, Dict, Optional, Tuple
+import asyncio
+
+from database import get_config
+import functions
+import metrics
+
+# Path prefix -> (kind, rows per minute or day of range, what a rejected request can do)
+ROUTES = {
+    "/ambient/": ("minute", 1, "narrow the range, page it with limit or set interval"),
+    "/inverter/": ("minute", 1, "narrow the range, page it with limit or set interval"),
+    "/timeline/": ("minute", 6, "narrow the range or set interval"),
+    "/yield/": ("daily", 1, "narrow the range"),
+    "/performance-ratio/": ("daily", 1, "narrow the range"),
+    "/efficiency/": ("daily", 1, "narrow the range"),
+    "/energy/": ("daily", 1, "narrow the range"),
+    "/comparison/": ("daily", 18, "narrow the range"),
+    "/systems/": ("daily", 18, "narrow the range"),
+}
+
+# Minutes of each `interval` value, finest first
+INTERVALS = {"5min": 5, "15min": 15, "30min": 30, "hour": 60}
+
+# Query parameters a downsampled request drops for its `interval`
+SKIPPED = ("interval", "limit", "after")
+
+decisions = metrics.Counter(
+    "pv_admission_decisions_total",
+    "Admission decisions (admitted, queued, downsampled, rejected).",
+    ("decision",),
+)
+queue_wait = metrics.Histogram(
+    "pv_admission_queue_seconds", "Wait of queued requests for their client budget."
+)
+
+
+def route(path: str) -> Optional[Tuple[str, int, Optional[str]]]:
+    for prefix, costing in ROUTES.items():
+        if path.startswith(prefix):
+            return costing
+    return None
+
+
+def requested(scope: Dict[str, Any]) -> Optional[Tuple[int, Dict[str, str]]]:
+    """Minutes or days of the requested range and the query, None when unknown."""
+    kind, _, _ = route(scope["path"])
+    params = {}
+    for candidate in scope["app"].router.routes:
+        match, child = candidate.matches(scope)
+        if match == Match.FULL:
+            params = child["path_params"]
+            break
+    query = dict(parse_qsl(scope["query_string"].decode()))
+    start_dt = params.get("start_dt")
+    end_dt = params.get("end_dt") or query.get("end_dt")
+    if start_dt is None:
+        return None
+
+    try:
+        dates = functions.sort_dates(functions.format_dates(start_dt, end_dt))
+        dates = functions.set_dates_range(dates)
+    except ValueError:
+        return None
+
+    if kind == "minute":
+        return int((dates[1] - dates[0]).total_seconds() // 60), query
+    return (dates[1] - dates[0]).days, query
+
+
+def estimate(scope: Dict[str, Any]) -> Optional[Tuple[str, int]]:
+    """Kind and estimated rows of a request, None for routes that are not costed.
+
+    Minute series read every point of the range unless paged by `limit` or
+    resampled by `interval` in SQL, `max_points` is applied after reading.
+    """
+    costing = route(scope["path"])
+    span = costing and requested(scope)
+    if not span:
+        return None
+    kind, weight, _ = costing
+    length, query = span
+
+    rows = length * weight
+    if kind == "minute" and query.get("limit", "").isdigit():
+        rows = min(rows, int(query["limit"]))
+    elif kind == "minute" and query.get("interval") in INTERVALS:
+        rows = length // INTERVALS[query["interval"]] * weight
+    return kind, rows
+
+
+def client_id(scope: Dict[str, Any]) -> str:
+    """First X-Forwarded-For address when `admission_trust_forwarded`, else the peer."""
+    if get_config().get("admission_trust_forwarded", False):
+        forwarded = Headers(scope=scope).get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class Budgets:
+    """Requests and estimated rows in flight per client."""
+
+    def __init__(self):
+        self.inflight: Dict[str, Tuple[int, int]] = {}
+        self._changed: Optional[asyncio.Condition] = None
+
+    @property
+    def changed(self) -> asyncio.Condition:
+        # Created on first use, within the running loop, not at import
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        return self._changed
+
+    def fits(self, client: str, rows: int) -> bool:
+        config = get_config()
+        count, used = self.inflight.get(client, (0, 0))
+        if count == 0:
+            return True
+        return count < config.get("admission_client_concurrency", 4) and (
+            used + rows <= config.get("admission_client_rows", 2000000)
+        )
+
+    def acquire(self, client: str, rows: int) -> None:
+        count, used = self.inflight.get(client, (0, 0))
+        self.inflight[client] = (count + 1, used + rows)
+
+    async def wait(self, client: str, rows: int, timeout: float) -> bool:
+        """Wait until the request fits, then take its share, False on timeout."""
+        async with self.changed:
+            try:
+                await asyncio.wait_for(
+                    self.changed.wait_for(lambda: self.fits(client, rows)), timeout
+                )
+            except asyncio.TimeoutError:
+                return False
+            self.acquire(client, rows)
+            return True
+
+    async def release(self, client: str, rows: int) -> None:
+        async with self.changed:
+            count, used = self.inflight.pop(client)
+            if count > 1:
+                self.inflight[client] = (count - 1, used - rows)
+            self.changed.notify_all()
+
+    def rows(self) -> int:
+        return sum(used for _, used in self.inflight.values())
+
+
+budgets = Budgets()
+metrics.register(
+    "pv_admission_inflight_rows",
+    "gauge",
+    "Estimated rows of the admitted requests in flight.",
+    budgets.rows,
+)
+
+
+def downsampled(
+    scope: Dict[str, Any], points: int
+) -> Optional[Tuple[Dict[str, Any], int]]:
+    """Scope resampled in SQL by the finest `interval` giving at most `points`
+    buckets and its estimated rows, None when even hours are too many.
+
+    Paging and a finer `interval` of the request are replaced.
+    """
+    _, weight, _ = route(scope["path"])
+    minutes, _ = requested(scope)
+    fitting = [value for value, size in INTERVALS.items() if minutes // size <= points]
+    if not fitting:
+        return None
+
+    query = parse_qsl(scope["query_string"].decode(), keep_blank_values=True)
+    query = [(key, value) for key, value in query if key not in SKIPPED]
+    query.append(("interval", fitting[0]))
+    rows = minutes // INTERVALS[fitting[0]] * weight
+    return {**scope, "query_string": urlencode(query).encode()}, rows
+
+
+def rejected(detail: str, rows: int, retry_after: int = None) -> JSONResponse:
+    decisions.inc(1, "rejected")
+    headers = {"X-Admission": "rejected", "X-Admission-Rows": str(rows)}
+    if retry_after is not None:
+        headers["Retry-After"] = str(retry_after)
+    return JSONResponse({"detail": detail}, status_code=429, headers=headers)
+
+
+class AdmissionMiddleware:
+    """Admit, queue, downsample or reject costed routes before they reach crud.
+
+    Requests estimated over `admission_max_rows` are resampled in SQL to
+    about `admission_points` points with the downsample policy when they are
+    minute series, rejected otherwise. Requests beyond the client's
+    budget of concurrent requests and rows are rejected with the reject policy
+    and wait up to `admission_queue_timeout` seconds with the others.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        config = get_config()
+        policy = config.get("admission_policy")
+        cost = scope["type"] == "http" and policy and estimate(scope)
+        if not cost:
+            await self.app(scope, receive, send)
+            return
+
+        kind, rows = cost
+        decision = "admitted"
+        over = rows > config.get("admission_max_rows", 1000000)
+        if over:
+            points = config.get("admission_points", 5000)
+            reduced = kind == "minute" and policy == "downsample"
+            reduced = reduced and downsampled(scope, points)
+            if not reduced:
+                hint = route(scope["path"])[2]
+                response = rejected(f"About {rows} rows estimated, {hint}", rows)
+                await response(scope, receive, send)
+                return
+            (scope, rows), decision = reduced, "downsampled"
+
+        client = client_id(scope)
+        if budgets.fits(client, rows):
+            budgets.acquire(client, rows)
+        elif policy == "reject":
+            response = rejected("Too many concurrent requests", rows, retry_after=1)
+            await response(scope, receive, send)
+            return
+        else:
+            start = perf_counter()
+            admitted = await budgets.wait(
+                client, rows, config.get("admission_queue_timeout", 10)
+            )
+            queue_wait.observe(perf_counter() - start)
+            if not admitted:
+                response = rejected("Too many concurrent requests", rows, retry_after=1)
+                await response(scope, receive, send)
+                return
+            if decision == "admitted":
+                decision = "queued"
+
+        decisions.inc(1, decision)
+
+        async def send_decision(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["X-Admission"] = decision
+                headers["X-Admission-Rows"] = str(rows)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_decision)
+        finally:
+            await budgets.release(client, rows)
+
+
+def is_timeout(exc: Exception) -> bool:
+    """True for MariaDB max_statement_time and MySQL max_execution_time interruptions."""
+    orig = getattr(exc, "orig", None)
+    code = orig.args[0] if orig is not None and orig.args else None
+    return code in (1969, 3024)
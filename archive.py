@@ -0,0 +1,196 @@
+"""Per month columnar archive of closed minute series, read memory-mapped.
+
+    python -m archive    # export every closed month not archived yet
+"""
+from sqlalchemy.orm import Session
+from pandas import DataFrame
+import pandas as pd
+from datetime import date, datetime, time
+from dateutil.relativedelta import relativedelta
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+import os
+import shutil
+
+from database import get_config
+
+
+def root() -> Optional[str]:
+    return get_config().get("archive_dir") or None
+
+
+def month_start(value: date) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def month_dir(col: str, key_id: int, month: datetime) -> str:
+    return os.path.join(root(), col, str(key_id), month.strftime("%Y-%m"))
+
+
+def is_closed(month: datetime) -> bool:
+    """Months ended `archive_grace_days` ago, late loads of minutes are rare by then."""
+    grace = relativedelta(days=get_config().get("archive_grace_days", 7))
+    return month + relativedelta(months=1) + grace <= datetime.combine(
+        date.today(), time()
+    )
+
+
+def months(dates: List[datetime]) -> List[Tuple[datetime, datetime]]:
+    """[start, end) pieces of the range cut at month boundaries."""
+    pieces = []
+    start = dates[0]
+    while start < dates[1]:
+        end = min(month_start(start) + relativedelta(months=1), dates[1])
+        pieces.append((start, end))
+        start = end
+    return pieces
+
+
+def write(col: str, key_id: int, month: datetime, df: DataFrame) -> None:
+    """Store the x and y of a month, replacing the directory in one rename."""
+    path = month_dir(col, key_id, month)
+    tmp = path + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    x = pd.to_datetime(df["x"]).to_numpy(dtype="datetime64[s]")
+    np.save(os.path.join(tmp, "x.npy"), x)
+    np.save(os.path.join(tmp, "y.npy"), df["y"].to_numpy(dtype="float"))
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(tmp, path)
+
+
+def stored(col: str, key_id: int, month: datetime) -> Optional[int]:
+    """Points archived for the month, None when it is not archived."""
+    try:
+        x = np.load(os.path.join(month_dir(col, key_id, month), "x.npy"), mmap_mode="r")
+    except FileNotFoundError:
+        return None
+    return len(x)
+
+
+def read(col: str, key_id: int, start: datetime, end: datetime) -> Optional[DataFrame]:
+    """Archived points in [start, end), None when the month is not archived."""
+    path = month_dir(col, key_id, month_start(start))
+    try:
+        x = np.load(os.path.join(path, "x.npy"), mmap_mode="r")
+        y = np.load(os.path.join(path, "y.npy"), mmap_mode="r")
+    except FileNotFoundError:
+        return None
+
+    lo, hi = np.searchsorted(x, [np.datetime64(start, "s"), np.datetime64(end, "s")])
+    return DataFrame({"x": x[lo:hi], "y": y[lo:hi]})
+
+
+def coverage(
+    col: str, key_id: int, dates: List[datetime]
+) -> Iterator[Tuple[List[datetime], Optional[int]]]:
+    """Pieces of the range in order with the points archived for their month,
+    None for the pieces to query. Consecutive months missing from the archive
+    are one piece.
+    """
+    if root() is None:
+        yield dates, None
+        return
+
+    pending = None
+    for start, end in months(dates):
+        points = stored(col, key_id, month_start(start))
+        if points is None:
+            pending = [pending[0] if pending else start, end]
+            continue
+        if pending:
+            yield pending, None
+            pending = None
+        yield [start, end], points
+    if pending:
+        yield pending, None
+
+
+def parts(
+    col: str, key_id: int, dates: List[datetime]
+) -> Iterator[Tuple[List[datetime], Optional[DataFrame]]]:
+    """Pieces of the range in order with their archived points, None for the
+    pieces to query, see `coverage`.
+    """
+    for part, points in coverage(col, key_id, dates):
+        yield part, None if points is None else read(col, key_id, *part)
+
+
+def read_series(
+    col: str,
+    key_id: int,
+    dates: List[datetime],
+    fetch: Callable[[List[datetime]], DataFrame],
+) -> DataFrame:
+    """x/y frame of the range, archived months from disk and the rest with `fetch`."""
+    frames = [
+        fetch(part) if df is None else df for part, df in parts(col, key_id, dates)
+    ]
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames, ignore_index=True)
+
+
+def drop(cols: Iterable[str], key_ids: Iterable[int], first: date, last: date) -> int:
+    """Delete the archived months overlapping [first, last], e.g. after ingesting them."""
+    if root() is None:
+        return 0
+
+    dropped = 0
+    for col in cols:
+        for key_id in key_ids:
+            month = month_start(first)
+            while month <= month_start(last):
+                path = month_dir(col, key_id, month)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                    dropped += 1
+                month += relativedelta(months=1)
+
+    return dropped
+
+
+def export(db: Session, sources: dict, first: datetime) -> int:
+    """Archive every closed month since `first` whose points are not archived yet.
+
+    `sources` maps a column to its key ids, a `fetch(key_id, dates)` and a
+    `count(key_id, dates)` of points per month. Months without points are
+    skipped and months whose count changed since they were archived, e.g.
+    minutes loaded late without /ingest, are written again.
+    """
+    exported = 0
+    for col, (key_ids, fetch, count) in sources.items():
+        for key_id in key_ids:
+            month = month_start(first)
+            closed = []
+            while is_closed(month):
+                closed.append(month)
+                month += relativedelta(months=1)
+            if not closed:
+                continue
+
+            counts = count(key_id, [closed[0], month])
+            for month in closed:
+                points = counts.get(month.date(), 0)
+                if points and stored(col, key_id, month) != points:
+                    end = month + relativedelta(months=1)
+                    write(col, key_id, month, fetch(key_id, [month, end]))
+                    exported += 1
+
+    return exported
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+    import crud
+
+    if root() is None:
+        raise SystemExit("Set archive_dir in config.json")
+
+    db = SessionLocal()
+    try:
+        exported = export(db, crud.archive_sources(db), crud.first_observation(db))
+    finally:
+        db.close()
+    print(f"exported {exported} months to {root()}")
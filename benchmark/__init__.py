@@ -0,0 +1,4 @@
+"""Reproducible benchmarks of the API against a synthetic SQLite stand-in.
+
+    python -m benchmark.run --systems 3 --years 0.25 --output results.json
+"""
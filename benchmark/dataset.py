@@ -0,0 +1,317 @@
+"""Synthetic PV dataset in a local SQLite stand-in of the MariaDB schema."""
+from sqlalchemy import (
+    Column,
+    Date,
+    DateTime,
+    Float,
+    ForeignKey,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    create_engine,
+    event,
+)
+from sqlalchemy.engine import Engine
+from datetime import datetime, timedelta
+from typing import Optional
+import numpy as np
+import math
+import os
+import sqlite3
+
+LABELS = ["PUCP", "UNI", "UNTRM", "UNAJ", "UNJBG", "UNSA"]
+TECHNOLOGIES = ["PERC", "HIT", "CIGS"]
+
+schema = MetaData()
+
+Table(
+    "locations",
+    schema,
+    Column("location_id", Integer, primary_key=True),
+    Column("city", String(50)),
+    Column("label", String(10)),
+    Column("latitude", Float),
+    Column("longitude", Float),
+    Column("altitude", Float),
+)
+Table(
+    "systems",
+    schema,
+    Column("system_id", Integer, primary_key=True),
+    Column("location_id", Integer, ForeignKey("locations.location_id")),
+    Column("technology", String(10)),
+    Column("nominal_power", Float),
+    Column("area", Float),
+    Column("row", Integer),
+    Column("parallel", Integer),
+    Column("commisioned", Date),
+    Column("inclination", Float),
+    Column("orientation", String(10)),
+    Column("azimuth", Float),
+    Column("alpha", Float),
+    Column("beta", Float),
+    Column("gamma", Float),
+    Column("noct", Float),
+    Column("efficiency", Float),
+)
+Table(
+    "observations",
+    schema,
+    Column("observation_id", Integer, primary_key=True),
+    Column("datetime", DateTime, index=True),
+)
+Table(
+    "irradiances",
+    schema,
+    Column(
+        "observation_id",
+        Integer,
+        ForeignKey("observations.observation_id"),
+        primary_key=True,
+    ),
+    Column(
+        "location_id", Integer, ForeignKey("locations.location_id"), primary_key=True
+    ),
+    Column("irradiance", Float),
+)
+Table(
+    "t_mods",
+    schema,
+    Column(
+        "observation_id",
+        Integer,
+        ForeignKey("observations.observation_id"),
+        primary_key=True,
+    ),
+    Column("system_id", Integer, ForeignKey("systems.system_id"), primary_key=True),
+    Column("t_mod", Float),
+)
+Table(
+    "inverters",
+    schema,
+    Column(
+        "observation_id",
+        Integer,
+        ForeignKey("observations.observation_id"),
+        primary_key=True,
+    ),
+    Column("system_id", Integer, ForeignKey("systems.system_id"), primary_key=True),
+    Column("voltage_dc", Float),
+    Column("current_dc", Float),
+    Column("power_dc", Float),
+    Column("power_ac", Float),
+)
+Table(
+    "performances",
+    schema,
+    Column("system_id", Integer, ForeignKey("systems.system_id"), primary_key=True),
+    Column("date", Date, primary_key=True),
+    Column("yield_reference", Float),
+    Column("yield_final", Float),
+    Column("yield_absolute", Float),
+    Column("performance_ratio", Float),
+    Column("efficiency_array", Float),
+    Column("efficiency_system", Float),
+    Column("efficiency_inverter", Float),
+    Column("energy_dc", Float),
+    Column("energy_ac", Float),
+)
+
+
+class StdDev:
+    """Population standard deviation, MariaDB's STDDEV."""
+
+    def __init__(self):
+        self.n, self.total, self.squares = 0, 0.0, 0.0
+
+    def step(self, value):
+        if value is not None:
+            self.n += 1
+            self.total += value
+            self.squares += value * value
+
+    def finalize(self):
+        if not self.n:
+            return None
+        mean = self.total / self.n
+        return math.sqrt(max(self.squares / self.n - mean * mean, 0.0))
+
+
+def to_seconds(value: str) -> Optional[int]:
+    """MariaDB's TO_SECONDS, seconds since year 0, of a stored DateTime."""
+    if value is None:
+        return None
+    delta = datetime.fromisoformat(value) - datetime(1970, 1, 1)
+    return delta // timedelta(seconds=1) + 62167219200
+
+
+def register_functions(dbapi_connection, connection_record=None) -> None:
+    """Add the MariaDB functions used by crud to a sqlite3 or aiosqlite connection."""
+    functions = [
+        ("create_aggregate", "stddev", 1, StdDev),
+        ("create_function", "sqrt", 1, lambda x: None if x is None else math.sqrt(x)),
+        ("create_function", "concat", -1, lambda *a: "".join(map(str, a))),
+        ("create_function", "floor", 1, lambda x: None if x is None else math.floor(x)),
+        ("create_function", "to_seconds", 1, to_seconds),
+    ]
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        for method, *args in functions:
+            getattr(dbapi_connection, method)(*args)
+    elif (
+        hasattr(dbapi_connection, "await_")
+        and "sqlite" in type(dbapi_connection).__module__
+    ):
+        aio = dbapi_connection._connection
+        for method, *args in functions:
+            dbapi_connection.await_(aio._execute(getattr(aio._conn, method), *args))
+
+
+def install() -> None:
+    """Register the functions on every new connection of any engine."""
+    if not event.contains(Engine, "connect", register_functions):
+        event.listen(Engine, "connect", register_functions)
+
+
+def timestamps(values: np.ndarray) -> np.ndarray:
+    """Format datetime64 values like SQLAlchemy stores DateTime in SQLite."""
+    return np.char.replace(np.datetime_as_string(values, unit="us"), "T", " ")
+
+
+def generate(
+    path: str,
+    systems: int = 3,
+    years: float = 1.0,
+    start: datetime = datetime(2021, 1, 1),
+    seed: int = 0,
+) -> str:
+    """Create `path` with `systems` systems and `years` of minute data from `start`."""
+    if os.path.exists(path):
+        os.remove(path)
+
+    rng = np.random.default_rng(seed)
+    days = max(int(round(years * 365)), 1)
+    locations = math.ceil(systems / len(TECHNOLOGIES))
+
+    engine = create_engine(f"sqlite:///{path}", future=True)
+    schema.create_all(engine)
+
+    minutes = np.arange(days * 1440)
+    stamps = np.datetime64(start, "m") + minutes
+    hours = (minutes % 1440) / 60
+    sun = np.clip(np.sin(np.pi * (hours - 6) / 12), 0, None)
+
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.executemany(
+            "INSERT INTO locations VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (i + 1, "City", LABELS[i % len(LABELS)], -12.0, -77.0, 100.0)
+                for i in range(locations)
+            ],
+        )
+        cursor.executemany(
+            "INSERT INTO systems VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    i + 1,
+                    i // len(TECHNOLOGIES) + 1,
+                    TECHNOLOGIES[i % len(TECHNOLOGIES)],
+                    3.0,
+                    1.6,
+                    10,
+                    1,
+                    "2019-01-01",
+                    10.0,
+                    "N",
+                    0.0,
+                    0.05,
+                    -0.3,
+                    -0.4,
+                    45.0,
+                    19.0,
+                )
+                for i in range(systems)
+            ],
+        )
+        cursor.executemany(
+            "INSERT INTO observations VALUES (?, ?)",
+            zip((minutes + 1).tolist(), timestamps(stamps).tolist()),
+        )
+
+        irradiances = {}
+        for loc in range(1, locations + 1):
+            clouds = np.repeat(rng.uniform(0.4, 1.0, days), 1440)
+            g = 1100 * sun * clouds * rng.uniform(0.95, 1.05, len(minutes))
+            irradiances[loc] = g
+            # About 1% of the minutes are missing, like logger dropouts
+            kept = rng.random(len(minutes)) >= 0.01
+            cursor.executemany(
+                "INSERT INTO irradiances VALUES (?, ?, ?)",
+                zip(
+                    (minutes[kept] + 1).tolist(),
+                    [loc] * int(kept.sum()),
+                    nulls(g[kept]),
+                ),
+            )
+
+        for sys_id in range(1, systems + 1):
+            g = irradiances[(sys_id - 1) // len(TECHNOLOGIES) + 1]
+            t_mod = 18 + 0.03 * g + rng.normal(0, 0.5, len(minutes))
+            power_dc = g / 1000 * 3000 * 0.85 * (1 - 0.004 * (t_mod - 25))
+            voltage_dc = np.where(g > 0, 300 + rng.normal(0, 5, len(minutes)), 0.0)
+            current_dc = np.divide(
+                power_dc, voltage_dc, out=np.zeros_like(power_dc), where=voltage_dc > 0
+            )
+            power_ac = power_dc * 0.96
+            cursor.executemany(
+                "INSERT INTO t_mods VALUES (?, ?, ?)",
+                zip((minutes + 1).tolist(), [sys_id] * len(minutes), nulls(t_mod)),
+            )
+            cursor.executemany(
+                "INSERT INTO inverters VALUES (?, ?, ?, ?, ?, ?)",
+                zip(
+                    (minutes + 1).tolist(),
+                    [sys_id] * len(minutes),
+                    nulls(voltage_dc),
+                    nulls(current_dc),
+                    nulls(power_dc),
+                    nulls(power_ac),
+                ),
+            )
+
+            # Daily metrics, kWh/m2 and kWh for a 3 kW, 16 m2 array
+            reference = g.reshape(days, 1440).sum(axis=1) / 60 / 1000
+            energy_dc = power_dc.reshape(days, 1440).sum(axis=1) / 60 / 1000
+            energy_ac = power_ac.reshape(days, 1440).sum(axis=1) / 60 / 1000
+            # Stored with a midnight time, crud compares them with datetimes
+            dates = timestamps(np.datetime64(start, "D") + np.arange(days))
+            cursor.executemany(
+                "INSERT INTO performances VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                zip(
+                    [sys_id] * days,
+                    dates.tolist(),
+                    nulls(reference),
+                    nulls(energy_dc / 3),
+                    nulls(energy_ac / 3),
+                    nulls(energy_ac / 3 / reference),
+                    nulls(energy_dc * 100 / (reference * 16)),
+                    nulls(energy_ac * 100 / (reference * 16)),
+                    nulls(energy_ac * 100 / energy_dc),
+                    nulls(energy_dc),
+                    nulls(energy_ac),
+                ),
+            )
+        raw.commit()
+    finally:
+        raw.close()
+        engine.dispose()
+
+    return path
+
+
+def nulls(values: np.ndarray) -> list:
+    out = values.astype(object)
+    out[np.isnan(values)] = None
+    return out.tolist()
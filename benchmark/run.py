@@ -0,0 +1,234 @@
+"""Drive every GET route of main.app in-process and report latency per range length.
+
+    python -m benchmark.run --systems 3 --years 1 --ranges 1,7,30,365 \
+        --repeat 5 --concurrency 1 --output results.json [--compare old.json]
+"""
+from datetime import date, timedelta
+from enum import Enum
+from fastapi.routing import APIRoute
+import argparse
+import asyncio
+import json
+import numpy as np
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from benchmark import dataset
+
+START = date(2021, 1, 1)
+PATH_VALUES = {"loc_id": "1", "sys_id": "1"}
+
+
+def configure(args: argparse.Namespace) -> None:
+    """Point the API at the stand-in database through a generated config file."""
+    os.makedirs(args.workdir, exist_ok=True)
+    db = os.path.abspath(os.path.join(args.workdir, "pv_bench.db"))
+    if args.regenerate or not os.path.exists(db):
+        print(f"generating {args.systems} systems x {args.years} years in {db}")
+        dataset.generate(db, systems=args.systems, years=args.years)
+
+    with open("config_sample.json") as f:
+        config = json.load(f)
+    config.update(
+        {
+            "url": f"sqlite:///{db}?check_same_thread=false",
+            "async_url": f"sqlite+aiosqlite:///{db}",
+            "async": args.use_async,
+            "cache_max_bytes": config.get("cache_max_bytes") if args.cache else 0,
+        }
+    )
+    for option in ["pool_size", "max_overflow", "schema_cache"]:
+        config.pop(option, None)
+
+    path = os.path.join(args.workdir, "config.json")
+    with open(path, "w") as f:
+        json.dump(config, f, indent=4)
+
+    os.environ["PV_CONFIG"] = path
+    dataset.install()
+
+
+def targets(app, ranges):
+    """Yield (route, path, query, days) for every GET route and range length."""
+    for route in app.routes:
+        if not isinstance(route, APIRoute) or "GET" not in route.methods:
+            continue
+        params = {}
+        for field in route.dependant.path_params:
+            if isinstance(field.type_, type) and issubclass(field.type_, Enum):
+                params[field.name] = list(field.type_)[0].value
+            else:
+                params[field.name] = PATH_VALUES.get(field.name, "")
+
+        if "start_dt" not in params:
+            yield route.path, route.path.format(**params), "", 0
+            continue
+
+        for days in ranges:
+            params["start_dt"] = START.isoformat()
+            end_dt = (START + timedelta(days=days - 1)).isoformat()
+            if "end_dt" in params:
+                params["end_dt"] = end_dt
+                query = ""
+            else:
+                query = f"end_dt={end_dt}"
+            yield route.path, route.path.format(**params), query, days
+
+
+async def request(app, path: str, query: str = ""):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": [(b"host", b"benchmark"), (b"accept", b"application/json")],
+        "client": ("127.0.0.1", 0),
+        "server": ("benchmark", 80),
+    }
+    response = {"status": None, "body": []}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return response["status"], b"".join(response["body"])
+
+
+def count_rows(content) -> int:
+    if isinstance(content, list):
+        return len(content)
+    if isinstance(content, dict):
+        values = list(content.values())
+        if values and all(isinstance(value, list) for value in values):
+            return len(values[0])
+        return sum(count_rows(value) for value in values)
+    return 0
+
+
+async def measure(app, path: str, query: str, repeat: int, concurrency: int):
+    status, body = await request(app, path, query)
+    try:
+        rows = count_rows(json.loads(body)) if status == 200 else 0
+    except ValueError:
+        # Plain text routes like /metrics
+        rows = 0
+
+    latencies = []
+
+    async def timed():
+        start = time.perf_counter()
+        await request(app, path, query)
+        latencies.append(time.perf_counter() - start)
+
+    wall = time.perf_counter()
+    for _ in range(repeat):
+        await asyncio.gather(*[timed() for _ in range(concurrency)])
+    wall = time.perf_counter() - wall
+
+    # One more request traced on its own, tracing would slow the timed ones
+    tracemalloc.start()
+    await request(app, path, query)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    ms = np.array(latencies) * 1000
+    return {
+        "status": status,
+        "rows": rows,
+        "bytes": len(body),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "requests_per_s": len(latencies) / wall,
+        "rows_per_s": rows * len(latencies) / wall,
+        "peak_alloc_kb": peak / 1024,
+    }
+
+
+async def benchmark(args: argparse.Namespace):
+    import main
+
+    await main.app.router.startup()
+    results = []
+    try:
+        for route, path, query, days in targets(main.app, args.ranges):
+            result = await measure(main.app, path, query, args.repeat, args.concurrency)
+            result.update({"route": route, "days": days})
+            results.append(result)
+            print(
+                f"{route:55} {days:>4}d  p50 {result['p50_ms']:9.1f} ms  "
+                f"p99 {result['p99_ms']:9.1f} ms  {result['rows_per_s']:12.0f} rows/s  "
+                f"{result['peak_alloc_kb'] / 1024:7.1f} MB"
+            )
+    finally:
+        await main.app.router.shutdown()
+
+    return results
+
+
+def compare(results, path: str) -> None:
+    with open(path) as f:
+        baseline = {(r["route"], r["days"]): r for r in json.load(f)["results"]}
+
+    print(f"\np50 against {path}")
+    for result in results:
+        old = baseline.get((result["route"], result["days"]))
+        if old and old["p50_ms"]:
+            ratio = result["p50_ms"] / old["p50_ms"]
+            print(f"{result['route']:55} {result['days']:>4}d  x{ratio:5.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--systems", type=int, default=3)
+    parser.add_argument("--years", type=float, default=1.0)
+    parser.add_argument("--ranges", default="1,7,30,365")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--async", dest="use_async", action="store_true")
+    parser.add_argument("--cache", action="store_true", help="keep the response cache")
+    parser.add_argument("--regenerate", action="store_true")
+    parser.add_argument("--workdir", default="bench_data")
+    parser.add_argument("--output", default="bench_data/results.json")
+    parser.add_argument("--compare")
+    args = parser.parse_args(argv)
+    args.ranges = [int(days) for days in args.ranges.split(",")]
+
+    configure(args)
+    results = asyncio.run(benchmark(args))
+
+    meta = {
+        "systems": args.systems,
+        "years": args.years,
+        "repeat": args.repeat,
+        "concurrency": args.concurrency,
+        "async": args.use_async,
+        "cache": args.cache,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    with open(args.output, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+    print(f"saved {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
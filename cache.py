@@ -0,0 +1,178 @@
+from collections import OrderedDict
+import asyncio
+from datetime import date, datetime, time, timedelta
+from pandas import DataFrame
+import sys
+import threading
+import time as clock
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from database import get_config
+import metrics
+
+
+def is_historical(dates: List[date], delay_days: int = 0) -> bool:
+    """True when the range ends `delay_days` before today, its data no longer changes."""
+    return dates[1] <= datetime.combine(
+        date.today() - timedelta(days=delay_days), time()
+    )
+
+
+def sizeof(value: Any) -> int:
+    if isinstance(value, DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """Least recently used cache bounded by an estimated memory budget.
+
+    Historical ranges are kept until evicted, ranges reaching today expire
+    after `ttl` seconds.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if (
+                entry is not None
+                and entry[1] is not None
+                and entry[1] < clock.monotonic()
+            ):
+                self._pop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any, dates: List[date]) -> None:
+        size = sizeof(value)
+        if size > self.max_bytes:
+            return
+        expires = None if is_historical(dates) else clock.monotonic() + self.ttl
+
+        with self.lock:
+            if key in self.entries:
+                self._pop(key)
+            self.entries[key] = (value, expires, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                self._pop(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate(self, match: Callable[[Hashable], bool]) -> int:
+        """Drop the entries whose key matches, returns how many were dropped."""
+        with self.lock:
+            keys = [key for key in self.entries if match(key)]
+            for key in keys:
+                self._pop(key)
+
+        return len(keys)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self.entries),
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _pop(self, key: Hashable) -> None:
+        _, _, size = self.entries.pop(key)
+        self.nbytes -= size
+
+
+class SingleFlight:
+    """Run one computation per key at a time, concurrent callers share its result.
+
+    Waiters are shielded from each other's cancellation, if the leader is
+    cancelled the next caller starts the computation again.
+    """
+
+    def __init__(self):
+        self.flights: Dict[Hashable, asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]) -> Any:
+        task = self.flights.get(key)
+        if task is not None:
+            self.coalesced += 1
+
+        while True:
+            task = self.flights.get(key)
+            if task is None:
+                self.leaders += 1
+                task = asyncio.ensure_future(fn())
+                self.flights[key] = task
+                task.add_done_callback(lambda done: self._land(key, done))
+                return await task
+
+            try:
+                return await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    raise
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self.flights),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
+
+    def _land(self, key: Hashable, task: asyncio.Future) -> None:
+        if self.flights.get(key) is task:
+            del self.flights[key]
+
+
+responses = LRUCache(
+    max_bytes=get_config().get("cache_max_bytes", 64 * 1024 * 1024),
+    ttl=get_config().get("cache_ttl", 60),
+)
+
+for name in ["hits", "misses", "evictions"]:
+    metrics.register(
+        f"pv_cache_{name}_total",
+        "counter",
+        f"Response cache {name}.",
+        lambda name=name: getattr(responses, name),
+    )
+flights = SingleFlight()
+
+metrics.register(
+    "pv_singleflight_leaders_total",
+    "counter",
+    "Computations started by the first of concurrent identical requests.",
+    lambda: flights.leaders,
+)
+metrics.register(
+    "pv_singleflight_coalesced_total",
+    "counter",
+    "Requests that waited on an identical computation instead of running it.",
+    lambda: flights.coalesced,
+)
+metrics.register(
+    "pv_cache_bytes", "gauge", "Response cache size.", lambda: responses.nbytes
+)
@@ -0,0 +1,159 @@
+"""Response compression negotiated from Accept-Encoding: zstd, brotli or gzip."""
+from starlette.datastructures import Headers, MutableHeaders
+from typing import Callable, Dict, List, Optional
+import zlib
+
+from database import get_config
+import metrics
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class Compressor:
+    """Incremental encoder, `compress` returns the bytes ready to send so far."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "zstd":
+            self.obj = zstandard.ZstdCompressor(level=3).compressobj()
+        elif encoding == "br":
+            self.obj = brotli.Compressor(quality=4)
+        else:
+            self.obj = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, last: bool) -> bytes:
+        """Compress a chunk, flushed so a streaming client can decode it now."""
+        with metrics.phase("compress"):
+            return self._compress(data, last)
+
+    def _compress(self, data: bytes, last: bool) -> bytes:
+        if self.encoding == "zstd":
+            if last:
+                flush = zstandard.COMPRESSOBJ_FLUSH_FINISH
+            else:
+                flush = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+            return self.obj.compress(data) + self.obj.flush(flush)
+        if self.encoding == "br":
+            out = self.obj.process(data)
+            return out + (self.obj.finish() if last else self.obj.flush())
+
+        out = self.obj.compress(data)
+        return out + self.obj.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+def available() -> Dict[str, bool]:
+    return {"zstd": zstandard is not None, "br": brotli is not None, "gzip": True}
+
+
+def choose(accept_encoding: str, preferred: List[str]) -> Optional[str]:
+    """First encoding of `preferred` the client accepts with a non-zero q."""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        coding, *params = [p.strip() for p in item.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        accepted[coding.lower()] = q
+
+    for encoding in preferred:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > 0 and available().get(encoding):
+            return encoding
+    return None
+
+
+class CompressionMiddleware:
+    """Compress response bodies of at least `compression_min_size` bytes.
+
+    Encodings are tried in the order of `compression` in config.json, zstd and
+    brotli only when their optional packages are installed. Streamed bodies
+    are compressed chunk by chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        config = get_config()
+        preferred = config.get("compression", ["zstd", "br", "gzip"])
+        encoding = choose(Headers(scope=scope).get("accept-encoding", ""), preferred)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = CompressingSend(
+            send, encoding, config.get("compression_min_size", 1024)
+        )
+        await self.app(scope, receive, responder)
+
+
+class CompressingSend:
+    """ASGI send holding the response start until the first body chunk tells
+    whether the response is worth compressing.
+    """
+
+    def __init__(self, send: Callable, encoding: str, min_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.min_size = min_size
+        self.start = None
+        self.compressor = None
+        self.passthrough = False
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            if "content-encoding" in headers or message["status"] in (204, 304):
+                self.passthrough = True
+                await self.send(message)
+            else:
+                self.start = message
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more = message.get("more_body", False)
+        if self.start is not None:
+            start, self.start = self.start, None
+            if not more and len(body) < self.min_size:
+                self.passthrough = True
+                await self.send(start)
+                await self.send(message)
+                return
+
+            self.compressor = Compressor(self.encoding)
+            body = self.compressor.compress(body, not more)
+            headers = MutableHeaders(scope=start)
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if more:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(body))
+            await self.send(start)
+            await self.send(
+                {"type": "http.response.body", "body": body, "more_body": more}
+            )
+            return
+
+        body = self.compressor.compress(body, not more)
+        await self.send({"type": "http.response.body", "body": body, "more_body": more})
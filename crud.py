@@ -1,18 +1,33 @@
-from sqlalchemy import select, func
+from sqlalchemy import select, func, extract, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
 import pandas as pd
 from pandas import DataFrame
-from datetime import date
-import json
-from typing import Dict, List
+from datetime import date, datetime
+from functools import partial
+import numpy as np
+import orjson
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple, Union
 
-from database import metadata
+from database import get_config, get_metadata
+import archive
+import functions
+import metrics
 
-config = json.load(open("config.json", "r"))
+
+def fetch(db: Session, stmt: Select) -> DataFrame:
+    """Run the statement into a frame, timed as the db phase of the request."""
+    with metrics.phase("db"):
+        rslt = db.execute(stmt)
+        df = pd.DataFrame(rslt.all(), columns=rslt.keys())
+    metrics.add_rows(len(df))
+
+    return df
 
 
 def get_locs(db: Session):
-    locs = metadata.tables["locations"]
+    locs = get_metadata().tables["locations"]
     stmt = select(locs.c.location_id, func.concat(locs.c.city, " - ", locs.c.label))
     rslt = db.execute(stmt)
     df = pd.DataFrame(rslt.all(), columns=["location_id", "label"])
@@ -21,22 +36,29 @@ def get_locs(db: Session):
 
 
 def get_sys(db: Session, loc_id: int):
-    sys = metadata.tables["systems"]
+    sys = get_metadata().tables["systems"]
     stmt = select(
         sys.c.location_id,
         sys.c.system_id,
         sys.c.technology,
     ).where(loc_id == sys.c.location_id)
-    rslt = db.execute(stmt)
-    df = pd.DataFrame(rslt.all(), columns=rslt.keys())
+    df = fetch(db, stmt)
     dct = df.to_dict("records")
 
     return dct
 
 
+def get_sys_ids(db: Session) -> List[int]:
+    sys = get_metadata().tables["systems"]
+    stmt = select(sys.c.system_id).order_by(sys.c.system_id)
+    rslt = db.execute(stmt)
+
+    return rslt.scalars().all()
+
+
 def get_sys_info(db: Session, sys_id: int):
-    sys = metadata.tables["systems"]
-    locs = metadata.tables["locations"]
+    sys = get_metadata().tables["systems"]
+    locs = get_metadata().tables["locations"]
     stmt = (
         select(
             sys.c.nominal_power,
@@ -56,7 +78,7 @@ def get_sys_info(db: Session, sys_id: int):
         .where(sys_id == sys.c.system_id)
     )
     rslt = db.execute(stmt)
-    df = pd.DataFrame(rslt.all(), columns=config["sys_info_cols"])
+    df = pd.DataFrame(rslt.all(), columns=get_config()["sys_info_cols"])
     df = df.transpose().reset_index()
 
     df.columns = ["x", "y"]
@@ -66,7 +88,7 @@ def get_sys_info(db: Session, sys_id: int):
 
 
 def get_tech_info(db: Session, sys_id: int):
-    sys = metadata.tables["systems"]
+    sys = get_metadata().tables["systems"]
     stmt = (
         select(
             sys.c.nominal_power / (sys.c.row * sys.c.parallel),
@@ -81,7 +103,7 @@ def get_tech_info(db: Session, sys_id: int):
         .distinct()
     )
     rslt = db.execute(stmt)
-    df = pd.DataFrame(rslt.all(), columns=config["tech_info_cols"])
+    df = pd.DataFrame(rslt.all(), columns=get_config()["tech_info_cols"])
     df = df.transpose().reset_index()
 
     df.columns = ["x", "y"]
@@ -90,27 +112,98 @@ def get_tech_info(db: Session, sys_id: int):
     return dct
 
 
-def get_perfs(db: Session, system_id: int, col: str, dates: List[date]) -> pd.DataFrame:
-    performances_table = metadata.tables["performances"]
+def perfs_stmt(
+    system_id: Union[int, List[int]], cols: List[str], dates: List[date]
+) -> Select:
+    """Daily values of the columns, a list of systems adds a system_id column."""
+    performances_table = get_metadata().tables["performances"]
+    keys = [performances_table.c.date]
+    if isinstance(system_id, list):
+        keys.insert(0, performances_table.c.system_id)
+        by_system = performances_table.c.system_id.in_(system_id)
+    else:
+        by_system = performances_table.c.system_id == system_id
+
     stmt = (
-        select(performances_table.c.date, performances_table.c[col])
-        .where(performances_table.c.system_id == system_id)
+        select(*keys, *[performances_table.c[col] for col in cols])
+        .where(by_system)
         .where(dates[0] <= performances_table.c.date)
         .where(performances_table.c.date < dates[1])
-        .where(performances_table.c[col].isnot(None))
-        .where(performances_table.c[col] > 0.0)
+        .where(and_(*[performances_table.c[col].isnot(None) for col in cols]))
+        .where(and_(*[performances_table.c[col] > 0.0 for col in cols]))
         .distinct()
     )
-    rslt = db.execute(stmt)
-    df = pd.DataFrame(rslt.all(), columns=rslt.keys())
+    return stmt
+
+
+def get_perfs(
+    db: Session,
+    system_id: Union[int, List[int]],
+    cols: Union[str, List[str]],
+    dates: List[date],
+) -> pd.DataFrame:
+    """Daily values of one or more columns, on days where all of them are valid."""
+    if isinstance(cols, str):
+        cols = [cols]
+
+    df = fetch(db, perfs_stmt(system_id, cols, dates))
+
+    return df
+
+
+def perfs_watermark(
+    db: Session, system_id: Union[int, List[int], None], dates: List[date]
+) -> tuple:
+    """Latest date and number of days one, several or all (None) systems have in the range."""
+    prfms = get_metadata().tables["performances"]
+    stmt = (
+        select(func.max(prfms.c.date), func.count())
+        .where(dates[0] <= prfms.c.date)
+        .where(prfms.c.date < dates[1])
+    )
+    if isinstance(system_id, list):
+        stmt = stmt.where(prfms.c.system_id.in_(system_id))
+    elif system_id is not None:
+        stmt = stmt.where(prfms.c.system_id == system_id)
+    with metrics.phase("db"):
+        latest, days = db.execute(stmt).one()
+
+    return latest, days
+
+
+def get_perfs_grouped(
+    db: Session,
+    system_id: Union[int, List[int]],
+    cols: List[str],
+    dates: List[date],
+    freq: str,
+) -> pd.DataFrame:
+    """Sum the columns by year (YS) or month (MS) and count the days of each bucket."""
+    daily = perfs_stmt(system_id, cols, dates).subquery()
+    buckets = [extract("year", daily.c.date).label("year")]
+    if isinstance(system_id, list):
+        buckets.insert(0, daily.c.system_id)
+    if freq == "MS":
+        buckets.append(extract("month", daily.c.date).label("month"))
+
+    stmt = (
+        select(
+            *buckets,
+            *[func.sum(daily.c[col]).label(col) for col in cols],
+            func.count().label("days"),
+        )
+        .group_by(*buckets)
+        .order_by(*buckets)
+    )
+    df = fetch(db, stmt)
 
     return df
 
 
 def get_perfs_cmp(db: Session, col: str, dates: List[date]):
-    prfms = metadata.tables["performances"]
-    locs = metadata.tables["locations"]
-    sys = metadata.tables["systems"]
+    prfms = get_metadata().tables["performances"]
+    locs = get_metadata().tables["locations"]
+    sys = get_metadata().tables["systems"]
     stmt = (
         select(
             locs.c.label,
@@ -129,72 +222,511 @@ def get_perfs_cmp(db: Session, col: str, dates: List[date]):
         .where(prfms.c[col] > 0.0)
         .group_by(sys.c.system_id)
     )
-    rslt = db.execute(stmt)
-    df = pd.DataFrame(rslt.all(), columns=rslt.keys())
+    df = fetch(db, stmt)
 
     return df
 
 
-def get_temps(db: Session, system_id: int, dates: List[date]):
-    obs = metadata.tables["observations"]
-    tmps = metadata.tables["t_mods"]
+def get_sys_labels(db: Session) -> pd.DataFrame:
+    sys = get_metadata().tables["systems"]
+    locs = get_metadata().tables["locations"]
+    stmt = (
+        select(sys.c.system_id, locs.c.label, sys.c.technology)
+        .join(locs, locs.c.location_id == sys.c.location_id)
+        .order_by(sys.c.system_id)
+    )
+    df = fetch(db, stmt)
+
+    return df
+
+
+def perfs_months(db: Session) -> Dict[date, int]:
+    """Rows of performances per month, compared by `ingest.sync` to find the
+    months written since, also by other workers or outside /ingest."""
+    prfms = get_metadata().tables["performances"]
+    year = extract("year", prfms.c.date)
+    month = extract("month", prfms.c.date)
+    stmt = select(year, month, func.count()).group_by(year, month)
+    with metrics.phase("db"):
+        rows = db.execute(stmt).all()
+
+    return {date(int(y), int(m), 1): count for y, m, count in rows}
+
+
+def get_perfs_since(db: Session, cols: List[str], since: date = None) -> pd.DataFrame:
+    """Daily rows of every system from `since` on, ordered by system and date."""
+    prfms = get_metadata().tables["performances"]
+    stmt = select(prfms.c.system_id, prfms.c.date, *[prfms.c[col] for col in cols])
+    if since is not None:
+        stmt = stmt.where(prfms.c.date >= since)
+    stmt = stmt.order_by(prfms.c.system_id, prfms.c.date)
+    df = fetch(db, stmt)
+
+    return df
+
+
+INVERTER_COLS = ["voltage_dc", "current_dc", "power_dc", "power_ac"]
+
+
+def series_range(
+    stmt: Select, dates: List[date], after: datetime = None, limit: int = None
+) -> Select:
+    """Restrict a series statement to the range, or to a page of it after `after`.
+
+    Pages walk the datetime index with LIMIT, one row past `limit` tells
+    `get_page` whether there is a next page, and duplicates are left to it.
+    """
+    obs = get_metadata().tables["observations"]
+    stmt = stmt.where(dates[0] <= obs.c.datetime).where(obs.c.datetime < dates[1])
+    if limit is None:
+        return stmt.distinct().order_by(obs.c.datetime)
+
+    if after is not None:
+        stmt = stmt.where(obs.c.datetime > after)
+    return stmt.order_by(obs.c.datetime).limit(limit + 1)
+
+
+def temps_stmt(
+    system_id: int, dates: List[date], after: datetime = None, limit: int = None
+) -> Select:
+    obs = get_metadata().tables["observations"]
+    tmps = get_metadata().tables["t_mods"]
     stmt = (
         select(obs.c.datetime, tmps.c.t_mod)
         .join(obs)
         .where(tmps.c.system_id == system_id)
-        .where(dates[0] <= obs.c.datetime)
-        .where(obs.c.datetime < dates[1])
-        .distinct()
     )
-    rslt = db.execute(stmt)
-    df = pd.DataFrame(rslt.all(), columns=["x", "y"])
-    dct = dict_format(df)
-    return dct
+    return series_range(stmt, dates, after, limit)
 
 
-def get_irrs(db: Session, loc_id: int, dates: List[date]):
-    obs = metadata.tables["observations"]
-    irr = metadata.tables["irradiances"]
+def irrs_stmt(
+    loc_id: int, dates: List[date], after: datetime = None, limit: int = None
+) -> Select:
+    obs = get_metadata().tables["observations"]
+    irr = get_metadata().tables["irradiances"]
     stmt = (
         select(obs.c.datetime, irr.c.irradiance)
         .join(obs)
         .where(irr.c.location_id == loc_id)
-        .where(dates[0] <= obs.c.datetime)
-        .where(obs.c.datetime < dates[1])
-        .distinct()
     )
-    rslt = db.execute(stmt)
-    df = pd.DataFrame(rslt.all(), columns=["x", "y"])
-    dct = dict_format(df)
+    return series_range(stmt, dates, after, limit)
+
+
+def invs_stmt(
+    system_id: int,
+    col: str,
+    dates: List[date],
+    after: datetime = None,
+    limit: int = None,
+) -> Select:
+    obs = get_metadata().tables["observations"]
+    inv = get_metadata().tables["inverters"]
+    stmt = (
+        select(obs.c.datetime, inv.c[col]).join(obs).where(inv.c.system_id == system_id)
+    )
+    return series_range(stmt, dates, after, limit)
 
-    return dct
+
+def irrs_series(loc_id: int) -> Tuple[str, int, Callable[..., Select]]:
+    """Archive column, key and statement builder of a location's irradiance."""
+    return "irradiance", loc_id, partial(irrs_stmt, loc_id)
 
 
-def get_invs(db: Session, system_id: int, col: str, dates: List[date]):
-    obs = metadata.tables["observations"]
-    inv = metadata.tables["inverters"]
+def temps_series(system_id: int) -> Tuple[str, int, Callable[..., Select]]:
+    return "t_mod", system_id, partial(temps_stmt, system_id)
+
+
+def invs_series(system_id: int, col: str) -> Tuple[str, int, Callable[..., Select]]:
+    return col, system_id, partial(invs_stmt, system_id, col)
+
+
+def timeline_stmt(system_id: int, dates: List[date]) -> Select:
+    """Irradiance of the system's location, module temperature and inverter
+    signals on one time axis, joining observations once."""
+    obs = get_metadata().tables["observations"]
+    irr = get_metadata().tables["irradiances"]
+    tmps = get_metadata().tables["t_mods"]
+    inv = get_metadata().tables["inverters"]
+    sys = get_metadata().tables["systems"]
+    location = (
+        select(sys.c.location_id).where(sys.c.system_id == system_id).scalar_subquery()
+    )
     stmt = (
-        select(obs.c.datetime, inv.c[col])
-        .join(obs)
-        .where(inv.c.system_id == system_id)
+        select(
+            obs.c.datetime,
+            irr.c.irradiance,
+            tmps.c.t_mod,
+            inv.c.voltage_dc,
+            inv.c.current_dc,
+            inv.c.power_dc,
+            inv.c.power_ac,
+        )
+        .select_from(obs)
+        .outerjoin(
+            irr,
+            and_(
+                irr.c.observation_id == obs.c.observation_id,
+                irr.c.location_id == location,
+            ),
+        )
+        .outerjoin(
+            tmps,
+            and_(
+                tmps.c.observation_id == obs.c.observation_id,
+                tmps.c.system_id == system_id,
+            ),
+        )
+        .outerjoin(
+            inv,
+            and_(
+                inv.c.observation_id == obs.c.observation_id,
+                inv.c.system_id == system_id,
+            ),
+        )
         .where(dates[0] <= obs.c.datetime)
         .where(obs.c.datetime < dates[1])
+        .where(
+            or_(
+                irr.c.observation_id.isnot(None),
+                tmps.c.observation_id.isnot(None),
+                inv.c.observation_id.isnot(None),
+            )
+        )
         .distinct()
+        .order_by(obs.c.datetime)
     )
-    rslt = db.execute(stmt)
-    df = pd.DataFrame(rslt.all(), columns=["x", "y"])
-    dct = dict_format(df)
+    return stmt
 
-    return dct
 
+def get_timeline(
+    db: Session,
+    system_id: int,
+    dates: List[date],
+    interval: str = None,
+    stat: str = "mean",
+) -> DataFrame:
+    if interval is not None:
+        return resampled_frame(db, timeline_stmt(system_id, dates), interval, stat)
 
-def dict_format(df: DataFrame) -> Dict[str, List]:
-    dct = df.to_dict("list")
-    return dct
+    df = fetch(db, timeline_stmt(system_id, dates))
+    df.rename({"datetime": "x"}, axis=1, inplace=True)
+
+    return df
+
+
+def latest_datetime(db: Session, stmt: Select) -> Optional[datetime]:
+    """Latest datetime of a series statement, found walking the datetime index
+    back from the end of the range rather than counting its rows."""
+    obs = get_metadata().tables["observations"]
+    stmt = stmt.with_only_columns(obs.c.datetime).order_by(obs.c.datetime.desc())
+    with metrics.phase("db"):
+        return db.execute(stmt.limit(1)).scalar()
+
+
+def series_watermark(
+    db: Session, series: Tuple[str, int, Callable[..., Select]], dates: List[date]
+) -> tuple:
+    """Latest datetime of the months missing from the archive and the points of
+    the archived ones, which are counted from the archive without a query."""
+    col, key_id, build = series
+    latest, archived = None, []
+    for part, points in archive.coverage(col, key_id, dates):
+        if points is None:
+            latest = latest_datetime(db, build(part)) or latest
+        else:
+            archived.append(points)
+
+    return latest, tuple(archived)
+
+
+def timeline_watermark(db: Session, system_id: int, dates: List[date]) -> tuple:
+    return (latest_datetime(db, timeline_stmt(system_id, dates)),)
+
+
+# TO_SECONDS of 1970-01-01, SQL buckets count seconds from year 0
+EPOCH_SECONDS = 62167219200
+
+AGGREGATES = {"mean": [func.avg], "min": [func.min], "max": [func.max]}
+AGGREGATES["min-max"] = AGGREGATES["min"] + AGGREGATES["max"]
+
+
+def resample_stmt(
+    stmt: Select, freq: str, stat: str = "mean", names: List[str] = None
+) -> Select:
+    """Bucket a series statement by `freq` in SQL, one row per bucket holding
+    points like `functions.resample`, so only the buckets are sent back.
+
+    `names` relabel the value columns, min-max adds _min and _max to them.
+    """
+    if stat not in AGGREGATES:
+        print("stat not supported:", stat)
+        raise ValueError
+
+    points = stmt.order_by(None).subquery()
+    seconds = functions.INTERVALS[freq]
+    bucket = func.floor(func.to_seconds(points.c.datetime) / seconds) * seconds
+    values = [col for col in points.c if col.name != "datetime"]
+    suffixes = ["_min", "_max"] if stat == "min-max" else [""]
+
+    aggregates = [
+        aggregate(col).label(name + suffix)
+        for col, name in zip(values, names or [col.name for col in values])
+        for aggregate, suffix in zip(AGGREGATES[stat], suffixes)
+    ]
+    return select(bucket.label("x"), *aggregates).group_by(bucket).order_by(bucket)
+
+
+def resampled_frame(
+    db: Session, stmt: Select, freq: str, stat: str = "mean", names: List[str] = None
+) -> DataFrame:
+    df = fetch(db, resample_stmt(stmt, freq, stat, names))
+    seconds = df["x"].to_numpy(dtype="int64") - EPOCH_SECONDS
+    df["x"] = seconds.astype("datetime64[s]")
+    cols = df.columns.drop("x")
+    df[cols] = df[cols].astype("float")
+
+    return df
+
+
+def series_frame(db: Session, stmt: Select) -> DataFrame:
+    df = fetch(db, stmt)
+    df.columns = ["x", "y"]
+
+    return df
+
+
+def shape_series(
+    db: Session,
+    series: Tuple[str, int, Callable[..., Select]],
+    dates: List[date],
+    max_points: int = None,
+    method: str = "lttb",
+    interval: str = None,
+    stat: str = "mean",
+) -> DataFrame:
+    """Minute series resampled by `interval` if given, in SQL or from the
+    archive, else downsampled to `max_points` from all of its points."""
+    col, key_id, build = series
+    if interval is None:
+        df = archived_series(db, col, key_id, build, dates)
+        return functions.downsample(df, max_points, method)
+
+    frames = [
+        resampled_frame(db, build(part), interval, stat, ["y"])
+        if df is None
+        else functions.resample(df, interval, stat)
+        for part, df in archive.parts(col, key_id, dates)
+    ]
+    frames = [df for df in frames if len(df)] or frames[:1]
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames, ignore_index=True)
+
+
+def get_page(
+    db: Session,
+    series: Tuple[str, int, Callable[..., Select]],
+    dates: List[date],
+    after: datetime,
+    limit: int,
+) -> Tuple[DataFrame, Optional[datetime]]:
+    """Page of a series after the cursor `after` and the cursor of the next one.
+
+    Archived months are read from disk, the others walk the datetime index
+    with LIMIT. One row past `limit` tells whether there is a next page, points
+    sharing its datetime never straddle two pages, they are left to the next
+    one. Raises ValueError when they fill the page, the cursor could not
+    move past them.
+    """
+    col, key_id, build = series
+    start = dates[0] if after is None else max(dates[0], after)
+    frames, wanted = [], limit + 1
+    for part, df in archive.parts(col, key_id, [start, dates[1]]):
+        if df is None:
+            df = series_frame(db, build(part, after, wanted - 1))
+        elif after is not None:
+            df = df[df["x"] > np.datetime64(after)]
+        frames.append(df.iloc[:wanted])
+        wanted -= len(frames[-1])
+        if wanted <= 0:
+            break
+    if not frames:
+        return DataFrame({"x": [], "y": []}), None
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+    if len(df) <= limit:
+        return df.drop_duplicates(ignore_index=True), None
+
+    past = df["x"].iloc[limit]
+    page = df.iloc[:limit]
+    if (page["x"] == past).all():
+        raise ValueError(f"More than {limit} points at {past}, raise limit")
+    page = page[page["x"] != past].drop_duplicates(ignore_index=True)
+
+    return page, pd.Timestamp(page["x"].iloc[-1]).to_pydatetime()
+
+
+def archived_series(
+    db: Session,
+    col: str,
+    key_id: int,
+    build: Callable[[List[date]], Select],
+    dates: List[date],
+) -> DataFrame:
+    """x/y frame of the range, closed months read from the archive when exported."""
+    return archive.read_series(
+        col, key_id, dates, lambda part: series_frame(db, build(part))
+    )
+
+
+def month_counts(db: Session, stmt: Select) -> Dict[date, int]:
+    """Distinct points per month of a series statement from `series_range`."""
+    points = stmt.subquery()
+    year = extract("year", points.c.datetime)
+    month = extract("month", points.c.datetime)
+    stmt = select(year, month, func.count()).group_by(year, month)
+    with metrics.phase("db"):
+        rows = db.execute(stmt).all()
+
+    return {date(int(y), int(m), 1): count for y, m, count in rows}
+
+
+def archive_sources(db: Session) -> Dict[str, tuple]:
+    """Key ids, range fetch and month counts of every archived column, for
+    `archive.export`."""
+    locs = get_metadata().tables["locations"]
+    loc_ids = db.execute(select(locs.c.location_id)).scalars().all()
+    sys_ids = get_sys_ids(db)
+
+    builders = {
+        "irradiance": (loc_ids, irrs_stmt),
+        "t_mod": (sys_ids, temps_stmt),
+    }
+    for col in INVERTER_COLS:
+        builders[col] = (
+            sys_ids,
+            lambda system_id, dates, col=col: invs_stmt(system_id, col, dates),
+        )
+
+    sources = {}
+    for col, (key_ids, build) in builders.items():
+        sources[col] = (
+            key_ids,
+            lambda key_id, dates, build=build: series_frame(db, build(key_id, dates)),
+            lambda key_id, dates, build=build: month_counts(db, build(key_id, dates)),
+        )
+
+    return sources
+
+
+def first_observation(db: Session):
+    obs = get_metadata().tables["observations"]
+
+    return db.execute(select(func.min(obs.c.datetime))).scalar()
+
+
+def stream_series(
+    db: Session,
+    series: Tuple[str, int, Callable[..., Select]],
+    dates: List[date],
+    chunk_size: int = None,
+) -> Iterator[bytes]:
+    """Yield the series as NDJSON, one {"x": [...], "y": [...]} line per chunk.
+
+    Archived months are chunked from disk, the others streamed from a server
+    side cursor.
+    """
+    chunk_size = chunk_size or get_config().get("stream_chunk_size", 10000)
+    col, key_id, build = series
+    for part, df in archive.parts(col, key_id, dates):
+        if df is not None:
+            yield from archived_chunks(df, chunk_size)
+            continue
+        rslt = db.execute(build(part).execution_options(stream_results=True))
+        for rows in rslt.partitions(chunk_size):
+            chunk = {"x": [row[0] for row in rows], "y": [row[1] for row in rows]}
+            yield orjson.dumps(chunk, default=float) + b"\n"
+
+
+async def astream_series(
+    db: AsyncSession,
+    series: Tuple[str, int, Callable[..., Select]],
+    dates: List[date],
+    chunk_size: int = None,
+) -> AsyncIterator[bytes]:
+    """Async counterpart of `stream_series`."""
+    chunk_size = chunk_size or get_config().get("stream_chunk_size", 10000)
+    col, key_id, build = series
+    for part, df in archive.parts(col, key_id, dates):
+        if df is not None:
+            for chunk in archived_chunks(df, chunk_size):
+                yield chunk
+            continue
+        rslt = await db.stream(build(part))
+        async for rows in rslt.partitions(chunk_size):
+            chunk = {"x": [row[0] for row in rows], "y": [row[1] for row in rows]}
+            yield orjson.dumps(chunk, default=float) + b"\n"
+
+
+def archived_chunks(df: DataFrame, chunk_size: int) -> Iterator[bytes]:
+    x = df["x"].to_numpy(dtype="datetime64[s]")
+    y = df["y"].to_numpy(dtype="float")
+    for start in range(0, len(df), chunk_size):
+        chunk = {"x": x[start : start + chunk_size], "y": y[start : start + chunk_size]}
+        yield orjson.dumps(chunk, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n"
+
+
+def get_temps(
+    db: Session,
+    system_id: int,
+    dates: List[date],
+    max_points: int = None,
+    method: str = "lttb",
+    interval: str = None,
+    stat: str = "mean",
+) -> DataFrame:
+    return shape_series(
+        db, temps_series(system_id), dates, max_points, method, interval, stat
+    )
+
+
+def get_irrs(
+    db: Session,
+    loc_id: int,
+    dates: List[date],
+    max_points: int = None,
+    method: str = "lttb",
+    interval: str = None,
+    stat: str = "mean",
+) -> DataFrame:
+    return shape_series(
+        db, irrs_series(loc_id), dates, max_points, method, interval, stat
+    )
+
+
+def get_invs(
+    db: Session,
+    system_id: int,
+    col: str,
+    dates: List[date],
+    max_points: int = None,
+    method: str = "lttb",
+    interval: str = None,
+    stat: str = "mean",
+) -> DataFrame:
+    return shape_series(
+        db, invs_series(system_id, col), dates, max_points, method, interval, stat
+    )
+
+
+_system_areas = {}
 
 
 def system_area(db: Session, system_id: int) -> float:
-    systems_table = metadata.tables["systems"]
+    if system_id in _system_areas:
+        return _system_areas[system_id]
+
+    systems_table = get_metadata().tables["systems"]
     stmt = select(
         systems_table.c.area * systems_table.c.row * systems_table.c.parallel
     ).where(systems_table.c.system_id == system_id)
@@ -202,6 +734,7 @@ def system_area(db: Session, system_id: int) -> float:
     rslt = db.execute(stmt)
 
     [sys_area] = rslt.one()
+    _system_areas[system_id] = sys_area
     return sys_area
 
 
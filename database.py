@@ -1,20 +1,393 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy import MetaData
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import (
+    AsyncConnection,
+    AsyncEngine,
+    AsyncSession,
+    create_async_engine,
+)
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.concurrency import run_in_threadpool
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+import asyncio
+import itertools
 import json
+import os
+import pickle
+import threading
+import time
 
-config = json.load(open("config.json", "r"))
+import metrics
 
-SQLALCHEMY_DATABASE_URL = f"mariadb+mariadbconnector://{config['usr']}:{config['pwd']}@{config['host']}:{config['port']}/{config['db']}"
+# Tables read by crud, the rest of the schema is never reflected
+TABLES = [
+    "locations",
+    "systems",
+    "observations",
+    "irradiances",
+    "t_mods",
+    "inverters",
+    "performances",
+]
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, future=True, pool_pre_ping=True)
+POOL_OPTIONS = ["pool_size", "max_overflow", "pool_recycle", "pool_timeout"]
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+metadata = MetaData()
+_metadata_lock = threading.Lock()
+_reflected = False
 
-session = SessionLocal()
 
-connection = engine.connect()
+@lru_cache()
+def get_config() -> Dict[str, Any]:
+    """Read config.json, or the file named by the PV_CONFIG environment variable."""
+    with open(os.environ.get("PV_CONFIG", "config.json"), "r") as f:
+        return json.load(f)
 
-metadata = MetaData()
-with engine.connect() as conn:
-    metadata.reflect(conn)
+
+def database_url(asynchronous: bool = False, config: Dict[str, Any] = None) -> str:
+    config = config or get_config()
+    if asynchronous:
+        if "async_url" in config:
+            return config["async_url"]
+        driver = config.get("async_driver", "aiomysql")
+        return f"mysql+{driver}://{config['usr']}:{config['pwd']}@{config['host']}:{config['port']}/{config['db']}"
+
+    if "url" in config:
+        return config["url"]
+    return f"mariadb+mariadbconnector://{config['usr']}:{config['pwd']}@{config['host']}:{config['port']}/{config['db']}"
+
+
+def pool_options(config: Dict[str, Any] = None) -> Dict[str, int]:
+    """Pool size, overflow, recycle and timeout set in config.json."""
+    config = config or get_config()
+    return {option: config[option] for option in POOL_OPTIONS if option in config}
+
+
+@lru_cache()
+def get_engine() -> Engine:
+    """Create the engine on first use, no connection is opened until a query runs."""
+    engine = create_engine(
+        database_url(), future=True, pool_pre_ping=True, **pool_options()
+    )
+    metrics.instrument_pool(engine.pool)
+    statement_timeout(engine)
+
+    return engine
+
+
+@lru_cache()
+def get_async_engine() -> AsyncEngine:
+    async_engine = create_async_engine(
+        database_url(asynchronous=True), pool_pre_ping=True, **pool_options()
+    )
+    metrics.instrument_pool(async_engine.sync_engine.pool)
+    statement_timeout(async_engine.sync_engine)
+    return async_engine
+
+
+@lru_cache()
+def get_async_sessionmaker() -> sessionmaker:
+    return sessionmaker(bind=get_async_engine(), class_=AsyncSession, autoflush=False)
+
+
+def statement_timeout(engine: Engine) -> None:
+    """Have MariaDB or MySQL interrupt statements running over `statement_timeout` seconds."""
+    seconds = get_config().get("statement_timeout")
+    if not seconds:
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_timeout(dbapi_connection, connection_record):
+        dialect = engine.dialect
+        if dialect.name not in ("mysql", "mariadb"):
+            return
+        if getattr(dialect, "is_mariadb", False):
+            stmt = f"SET SESSION max_statement_time = {float(seconds)}"
+        else:
+            stmt = f"SET SESSION max_execution_time = {int(seconds * 1000)}"
+        cursor = dbapi_connection.cursor()
+        cursor.execute(stmt)
+        cursor.close()
+
+
+class Replicas:
+    """Read replicas listed in `replicas`, picked round robin among the healthy ones.
+
+    Each entry overrides the connection settings of config.json, e.g.
+    `{"host": "replica1"}` or `{"url": "sqlite:///replica1.db"}`. A replica is
+    marked down when connecting to it fails and up again when a probe of the
+    checker thread, every `replica_check_interval` seconds, succeeds.
+    """
+
+    def __init__(self, configs: List[Dict[str, Any]]):
+        primary = {
+            key: value
+            for key, value in get_config().items()
+            if key not in ("url", "async_url", "replicas")
+        }
+        self.configs = [{**primary, **config} for config in configs]
+        self.healthy = [True] * len(configs)
+        self.served = [0] * len(configs)
+        self.engines: Dict[Tuple[int, bool], Union[Engine, AsyncEngine]] = {}
+        self.turn = itertools.count()
+        self.lock = threading.Lock()
+        self.checker = None
+
+    def engine(self, index: int, asynchronous: bool = False):
+        """Engine of a replica, created on first use like the primary's."""
+        with self.lock:
+            key = (index, asynchronous)
+            if key not in self.engines:
+                self.engines[key] = self._create(index, asynchronous)
+            return self.engines[key]
+
+    def _create(self, index: int, asynchronous: bool):
+        config = self.configs[index]
+        url = database_url(asynchronous, config)
+        if asynchronous:
+            engine = create_async_engine(
+                url, pool_pre_ping=True, **pool_options(config)
+            )
+            sync_engine = engine.sync_engine
+        else:
+            engine = create_engine(
+                url, future=True, pool_pre_ping=True, **pool_options(config)
+            )
+            sync_engine = engine
+        metrics.instrument_pool(sync_engine.pool)
+        statement_timeout(sync_engine)
+
+        @event.listens_for(sync_engine, "handle_error")
+        def mark_down(context):
+            if context.connection is None or context.is_disconnect:
+                self.healthy[index] = False
+
+        return engine
+
+    def pick(self) -> Optional[int]:
+        """Next healthy replica, None when all of them are down."""
+        self.start()
+        start = next(self.turn)
+        for offset in range(len(self.configs)):
+            index = (start + offset) % len(self.configs)
+            if self.healthy[index]:
+                self.served[index] += 1
+                return index
+        return None
+
+    def index(self, bind) -> Optional[int]:
+        for (index, _), engine in self.engines.items():
+            if engine is bind:
+                return index
+        return None
+
+    def check(self) -> None:
+        """Probe every replica with SELECT 1 on its sync engine."""
+        for index in range(len(self.configs)):
+            try:
+                with self.engine(index).connect() as conn:
+                    conn.exec_driver_sql("SELECT 1")
+                self.healthy[index] = True
+            except Exception:
+                self.healthy[index] = False
+
+    def start(self) -> None:
+        with self.lock:
+            if self.checker is not None:
+                return
+            self.checker = threading.Thread(target=self._check_forever, daemon=True)
+        self.checker.start()
+
+    def _check_forever(self) -> None:
+        interval = get_config().get("replica_check_interval", 5)
+        while True:
+            time.sleep(interval)
+            self.check()
+
+
+@lru_cache()
+def get_replicas() -> Optional[Replicas]:
+    configs = get_config().get("replicas")
+    return Replicas(configs) if configs else None
+
+
+def SessionLocal() -> Session:
+    return Session(bind=get_engine(), autocommit=False, autoflush=False, future=True)
+
+
+def AsyncSessionLocal() -> AsyncSession:
+    return get_async_sessionmaker()()
+
+
+def ReadSessionLocal() -> Session:
+    """Session on the next healthy replica, on the primary without one."""
+    replicas = get_replicas()
+    index = replicas.pick() if replicas else None
+    if index is None:
+        return SessionLocal()
+
+    bind = replicas.engine(index)
+    return Session(bind=bind, autocommit=False, autoflush=False, future=True)
+
+
+def AsyncReadSessionLocal() -> AsyncSession:
+    replicas = get_replicas()
+    index = replicas.pick() if replicas else None
+    if index is None:
+        return AsyncSessionLocal()
+
+    return AsyncSession(bind=replicas.engine(index, asynchronous=True), autoflush=False)
+
+
+def pool_stats() -> List[Dict[str, Any]]:
+    """Checked in and out connections and health of the primary and every replica."""
+    engines = [("primary", get_engine(), True, None)]
+    replicas = get_replicas()
+    if replicas:
+        for (index, asynchronous), engine in sorted(
+            replicas.engines.items(), key=lambda item: item[0]
+        ):
+            name = f"replica-{index}" + ("-async" if asynchronous else "")
+            engine = engine.sync_engine if asynchronous else engine
+            engines.append(
+                (name, engine, replicas.healthy[index], replicas.served[index])
+            )
+
+    stats = []
+    for name, engine, healthy, served in engines:
+        pool = engine.pool
+        stats.append(
+            {
+                "engine": name,
+                "url": engine.url.render_as_string(hide_password=True),
+                "healthy": healthy,
+                "served": served,
+                "pool": type(pool).__name__,
+                **{
+                    attr: getattr(pool, attr)()
+                    for attr in ["size", "checkedin", "checkedout", "overflow"]
+                    if hasattr(pool, attr)
+                },
+            }
+        )
+    return stats
+
+
+def get_metadata() -> MetaData:
+    """Reflect the used tables once, or load them from the `schema_cache` snapshot.
+
+    Delete the snapshot file after a schema migration.
+    """
+    global _reflected
+    if _reflected:
+        return metadata
+
+    with _metadata_lock:
+        if not _reflected:
+            _reflect(get_config().get("schema_cache"))
+            _reflected = True
+
+    return metadata
+
+
+def _reflect(path: str = None) -> None:
+    if path and os.path.exists(path):
+        with open(path, "rb") as f:
+            snapshot = pickle.load(f)
+        for table in snapshot.sorted_tables:
+            table.to_metadata(metadata)
+        return
+
+    with get_engine().connect() as conn:
+        metadata.reflect(conn, only=TABLES)
+
+    if path:
+        with open(path, "wb") as f:
+            pickle.dump(metadata, f)
+
+
+class ThreadConnection:
+    """Blocking view of an AsyncConnection for code running in the threadpool."""
+
+    def __init__(self, conn: AsyncConnection, loop: asyncio.AbstractEventLoop):
+        self.conn = conn
+        self.loop = loop
+        self.dialect = conn.dialect
+
+    def wait(self, awaitable: Awaitable) -> Any:
+        return asyncio.run_coroutine_threadsafe(awaitable, self.loop).result()
+
+    def execute(self, *args, **kwargs):
+        return self.wait(self.conn.execute(*args, **kwargs))
+
+    def exec_driver_sql(self, *args, **kwargs):
+        return self.wait(self.conn.exec_driver_sql(*args, **kwargs))
+
+
+class ThreadSession(ThreadConnection):
+    """Blocking view of an AsyncSession for crud functions run in the threadpool.
+
+    Each statement is awaited on the event loop, which only does the I/O, and
+    the frames are built in the worker thread like with sync sessions.
+    """
+
+    def __init__(self, session: AsyncSession, loop: asyncio.AbstractEventLoop):
+        self.conn = session
+        self.loop = loop
+        self.bind = session.bind
+
+    def scalar(self, *args, **kwargs):
+        return self.wait(self.conn.scalar(*args, **kwargs))
+
+    def commit(self) -> None:
+        self.wait(self.conn.commit())
+
+    def rollback(self) -> None:
+        self.wait(self.conn.rollback())
+
+    def connection(self) -> ThreadConnection:
+        return ThreadConnection(self.wait(self.conn.connection()), self.loop)
+
+
+async def run(db: Union[Session, AsyncSession], fn: Callable, *args) -> Any:
+    """Call `fn(session, *args)` in the threadpool without blocking the event loop.
+
+    Async sessions are passed as a `ThreadSession`, their queries still run
+    on the loop.
+    A replica session that cannot reach its replica is moved to the primary
+    and the call repeated.
+    """
+    try:
+        return await _run(db, fn, *args)
+    except DBAPIError as e:
+        if not await failover(db, e):
+            raise
+        return await _run(db, fn, *args)
+
+
+async def _run(db: Union[Session, AsyncSession], fn: Callable, *args) -> Any:
+    if isinstance(db, AsyncSession):
+        db = ThreadSession(db, asyncio.get_running_loop())
+
+    return await run_in_threadpool(fn, db, *args)
+
+
+async def failover(db: Union[Session, AsyncSession], error: DBAPIError) -> bool:
+    """Rebind a replica session to the primary after a connection error."""
+    replicas = get_replicas()
+    index = replicas.index(db.bind) if replicas else None
+    if index is None or not (error.connection_invalidated or error.statement is None):
+        return False
+
+    replicas.healthy[index] = False
+    if isinstance(db, AsyncSession):
+        await db.close()
+        db.bind = get_async_engine()
+        db.sync_session.bind = db.bind.sync_engine
+    else:
+        await run_in_threadpool(db.close)
+        db.bind = get_engine()
+    return True
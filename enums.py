@@ -8,6 +8,25 @@ class Inverters(str, Enum):
     power_ac = "power-ac"
 
 
+class Downsamplings(str, Enum):
+    lttb = "lttb"
+    min_max = "min-max"
+
+
+class Intervals(str, Enum):
+    T5 = "5min"
+    T15 = "15min"
+    T30 = "30min"
+    H = "hour"
+
+
+class Statistics(str, Enum):
+    mean = "mean"
+    min = "min"
+    max = "max"
+    min_max = "min-max"
+
+
 class Aggregations(str, Enum):
     D = "date"
     # W = "week"
@@ -36,6 +55,14 @@ class Energies(str, Enum):
     energy_ac = "ac"
 
 
+class Totals(str, Enum):
+    yield_reference = "reference-yield"
+    yield_final = "array-yield"
+    yield_absolute = "system-yield"
+    energy_dc = "dc-energy"
+    energy_ac = "ac-energy"
+
+
 class Comparations(str, Enum):
     yield_reference = "reference-yield"
     yield_final = "array-yield"
@@ -52,3 +79,11 @@ class Technologies(str, Enum):
     PERC = "perc"
     HIT = "hit"
     CIGS = "cigs"
+
+
+class Ingestions(str, Enum):
+    observations = "observations"
+    irradiances = "irradiances"
+    t_mods = "t_mods"
+    inverters = "inverters"
+    performances = "performances"
@@ -1,8 +1,9 @@
 from datetime import date, timedelta, datetime
 from dateutil.relativedelta import relativedelta
 from pandas import DataFrame, to_datetime, Grouper
+import numpy as np
 
-from typing import List
+from typing import Dict, List, Optional
 
 
 def format_date(date: str) -> date:
@@ -72,6 +73,138 @@ def groupby(df: DataFrame, freq: str) -> DataFrame:
     return df
 
 
+def format_buckets(df: DataFrame, freq: str) -> DataFrame:
+    """Label SQL year/month buckets like `groupby` does."""
+    keys = [col for col in ["system_id"] if col in df]
+    cols = [col for col in df.columns if col not in keys + ["year", "month", "days"]]
+    month = df["month"] if freq == "MS" else 1
+    dates = to_datetime(DataFrame({"year": df["year"], "month": month, "day": 1}))
+
+    out = df[keys].copy()
+    out["date"] = dates.dt.strftime("%Y-%m" if freq == "MS" else "%Y")
+    out[cols] = df[cols].astype("float")
+    out["text"] = [f"days: {d}" for d in df["days"]]
+    return out
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets, returns the indexes of the kept points."""
+    n = len(x)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+
+    # Bucket averages, each one is the third vertex of the previous bucket
+    valid = ~np.isnan(y)
+    counts = np.add.reduceat(valid[: n - 1], starts)
+    x_avg = np.add.reduceat(x[: n - 1], starts) / np.diff(edges)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        y_avg = np.add.reduceat(np.where(valid, y, 0.0)[: n - 1], starts) / counts
+    x_avg = np.append(x_avg[1:], x[-1])
+    y_avg = np.append(y_avg[1:], y[-1])
+
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i, (lo, hi) in enumerate(zip(starts, ends)):
+        area = np.abs(
+            (x[a] - x_avg[i]) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (y_avg[i] - y[a])
+        )
+        a = lo + int(np.argmax(np.where(np.isnan(area), -1.0, area)))
+        idx[i + 1] = a
+
+    return idx
+
+
+def min_max(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Minimum and maximum of each bucket, returns the indexes of the kept points."""
+    n = len(y)
+    buckets = np.arange(n) * max(n_out // 2, 1) // n
+    first = np.flatnonzero(np.r_[True, np.diff(buckets) != 0])
+
+    lows = np.lexsort((np.where(np.isnan(y), np.inf, y), buckets))
+    highs = np.lexsort((np.where(np.isnan(y), np.inf, -y), buckets))
+
+    return np.union1d(lows[first], highs[first])
+
+
+def downsample(
+    df: DataFrame, max_points: int = None, method: str = "lttb"
+) -> DataFrame:
+    if max_points is None or len(df) <= max_points:
+        return df
+
+    y = df["y"].to_numpy(dtype="float")
+    if method == "lttb":
+        x = to_datetime(df["x"]).to_numpy(dtype="datetime64[ns]").astype("int64")
+        idx = lttb((x - x[0]).astype("float"), y, max_points)
+    elif method == "min-max":
+        idx = min_max(y, max_points)
+    else:
+        print("method not supported:", method)
+        raise ValueError
+
+    return df.iloc[idx].reset_index(drop=True)
+
+
+INTERVALS = {"T5": 300, "T15": 900, "T30": 1800, "H": 3600}
+
+
+def resample(df: DataFrame, freq: str, stat: str = "mean") -> DataFrame:
+    """Bucket an ordered minute series on the epoch by `freq` in one NumPy pass.
+
+    `stat` is mean, min or max of each bucket for every column besides x,
+    min-max returns both as <column>_min and <column>_max.
+    """
+    if df.empty:
+        return df
+
+    x = to_datetime(df["x"]).to_numpy(dtype="datetime64[s]").astype("int64")
+    # Series are ordered by datetime, each bucket is a contiguous run
+    buckets = x // INTERVALS[freq] * INTERVALS[freq]
+    starts = np.flatnonzero(np.r_[True, np.diff(buckets) != 0])
+
+    out = DataFrame({"x": buckets[starts].astype("datetime64[s]")})
+    for col in df.columns.drop("x"):
+        y = df[col].to_numpy(dtype="float")
+        valid = ~np.isnan(y)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if stat == "mean":
+                counts = np.add.reduceat(valid, starts)
+                out[col] = np.add.reduceat(np.where(valid, y, 0.0), starts) / counts
+            elif stat in ["min", "max", "min-max"]:
+                lows = np.minimum.reduceat(np.where(valid, y, np.inf), starts)
+                highs = np.maximum.reduceat(np.where(valid, y, -np.inf), starts)
+                lows[np.isinf(lows)] = np.nan
+                highs[np.isinf(highs)] = np.nan
+                if stat == "min-max":
+                    out[f"{col}_min"], out[f"{col}_max"] = lows, highs
+                else:
+                    out[col] = lows if stat == "min" else highs
+            else:
+                print("stat not supported:", stat)
+                raise ValueError
+
+    return out
+
+
+def groupby_systems(df: DataFrame) -> DataFrame:
+    """Daily sums per system, the multi-system counterpart of `groupby` by date."""
+    df = df.dropna()
+    df["date"] = to_datetime(df["date"])
+
+    return df.groupby(["system_id", "date"], as_index=False).sum()
+
+
+def split_systems(df: DataFrame, system_ids: List[int]) -> Dict[int, DataFrame]:
+    empty = df.drop(columns="system_id").iloc[:0]
+    data = {system_id: empty for system_id in system_ids}
+    for system_id, group in df.groupby("system_id"):
+        data[int(system_id)] = group.drop(columns="system_id")
+
+    return data
+
+
 def format_comparison(rslt: DataFrame):
 
     locations = ["PUCP", "UNI", "UNTRM", "UNSA", "UNAJ", "UNJBG"]
@@ -89,3 +222,9 @@ def format_comparison(rslt: DataFrame):
         data[loc] = {"techs": techs, "avg": avg, "se": se, "days": days}
 
     return data
+
+
+def first_change(old: Dict[date, int], new: Dict[date, int]) -> Optional[date]:
+    """Earliest key whose count differs between the two snapshots."""
+    changed = [key for key in old.keys() | new.keys() if old.get(key) != new.get(key)]
+    return min(changed, default=None)
@@ -0,0 +1,283 @@
+from sqlalchemy import DateTime, Table, select
+from sqlalchemy.orm import Session
+from pandas import DataFrame
+import pandas as pd
+from datetime import date, datetime, time, timedelta
+from dateutil.relativedelta import relativedelta
+from time import perf_counter
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple
+import io
+import orjson
+
+from database import get_config, get_metadata
+import archive
+import cache
+import crud
+import functions
+import metrics
+import rollups
+import stats
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+CSV = "text/csv"
+NDJSON = "application/x-ndjson"
+ARROW = "application/vnd.apache.arrow.stream"
+
+# Columns identifying a row besides its datetime (date for performances)
+KEYS = {
+    "observations": [],
+    "irradiances": ["location_id"],
+    "t_mods": ["system_id"],
+    "inverters": ["system_id"],
+    "performances": ["system_id"],
+}
+
+# Archived columns of the minute tables
+ARCHIVED = {
+    "irradiances": ["irradiance"],
+    "t_mods": ["t_mod"],
+    "inverters": crud.INVERTER_COLS,
+}
+
+rows = metrics.Counter(
+    "pv_ingested_rows_total", "Rows inserted by the ingest route.", ("table",)
+)
+
+# Rows per month of performances at the last `sync`
+synced_months: Optional[Dict[date, int]] = None
+
+
+def parse(body: bytes, media_type: str) -> DataFrame:
+    """Read a CSV, NDJSON or Arrow IPC stream payload."""
+    if media_type == CSV:
+        return pd.read_csv(io.BytesIO(body))
+    if media_type == NDJSON:
+        return DataFrame(
+            [orjson.loads(line) for line in body.splitlines() if line.strip()]
+        )
+    if media_type == ARROW and pyarrow is not None:
+        return pyarrow.ipc.open_stream(body).read_all().to_pandas()
+
+    raise ValueError(f"Unsupported content type: {media_type}")
+
+
+def ingest(db: Session, name: str, df: DataFrame) -> Dict[str, Any]:
+    """Insert the rows that are not stored yet, in one transaction.
+
+    Minute rows carry a `datetime` that is mapped to (or creates) its
+    observation, performances rows carry a `date`. Rows repeating a stored
+    (key, datetime) pair, or an earlier row of the payload, are skipped.
+    """
+    start = perf_counter()
+    table = get_metadata().tables[name]
+    received = len(df)
+
+    stamp = "date" if name == "performances" else "datetime"
+    index = KEYS[name] + [stamp]
+    missing = [col for col in index if col not in df]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+    values = [col for col in df.columns if col in table.c and col not in index]
+    df = df[index + values].drop_duplicates(index, keep="last")
+    df[stamp] = pd.to_datetime(df[stamp])
+
+    if name == "performances":
+        # Stored like the rest of the table, a datetime at midnight
+        df["date"] = df["date"].dt.normalize()
+        inserted = insert_new(db, table, df, index, values)
+    else:
+        ids, inserted = observation_ids(db, df["datetime"])
+        if name != "observations":
+            df = df.merge(ids, on="datetime").drop(columns="datetime")
+            index = KEYS[name] + ["observation_id"]
+            inserted = insert_new(db, table, df, index, values)
+    db.commit()
+
+    invalidated = 0
+    if name == "performances" and inserted:
+        first, last = df["date"].min().date(), df["date"].max().date()
+        invalidated = invalidate(db, set(df["system_id"]), first, last)
+    elif name in ARCHIVED and inserted:
+        stamps = ids[ids["observation_id"].isin(df["observation_id"])]["datetime"]
+        invalidated = archive.drop(
+            ARCHIVED[name],
+            {int(key_id) for key_id in df[KEYS[name][0]]},
+            stamps.min(),
+            stamps.max(),
+        )
+
+    rows.inc(inserted, name)
+    seconds = perf_counter() - start
+    return {
+        "table": name,
+        "received": received,
+        "inserted": inserted,
+        "duplicates": received - inserted,
+        "invalidated": invalidated,
+        "seconds": seconds,
+        "rows_per_s": inserted / seconds if seconds else 0.0,
+    }
+
+
+def observation_ids(db: Session, datetimes: pd.Series) -> Tuple[DataFrame, int]:
+    """datetime and observation_id of every stamp, creating the missing observations."""
+    obs = get_metadata().tables["observations"]
+    stamps = datetimes.drop_duplicates()
+    stmt = select(obs.c.datetime, obs.c.observation_id).where(
+        obs.c.datetime.between(native(stamps.min()), native(stamps.max()))
+    )
+
+    known = read_ids(db, stmt)
+    new = stamps[~stamps.isin(known["datetime"])]
+    if len(new):
+        insert_rows(db, obs, DataFrame({"datetime": new}))
+        known = read_ids(db, stmt)
+
+    return known, len(new)
+
+
+def read_ids(db: Session, stmt) -> DataFrame:
+    known = crud.fetch(db, stmt)
+    known["datetime"] = pd.to_datetime(known["datetime"])
+    return known.drop_duplicates("datetime")
+
+
+def insert_new(
+    db: Session, table: Table, df: DataFrame, index: List[str], values: List[str]
+) -> int:
+    """Insert the rows whose index is not in the table yet, returns their count."""
+    if df.empty:
+        return 0
+
+    stmt = select(*[table.c[col] for col in index])
+    for col in index:
+        lo, hi = [native(value) for value in (df[col].min(), df[col].max())]
+        stmt = stmt.where(table.c[col].between(lo, hi))
+    existing = crud.fetch(db, stmt)
+    existing[index] = existing[index].astype(df[index].dtypes.to_dict())
+
+    df = df.merge(existing, on=index, how="left", indicator=True)
+    df = df[df["_merge"] == "left_only"][index + values]
+    insert_rows(db, table, df)
+
+    return len(df)
+
+
+def native(value: Any) -> Any:
+    """NumPy scalars as Python ones, DBAPI drivers do not bind the former."""
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    return value.item() if hasattr(value, "item") else value
+
+
+def insert_rows(db: Session, table: Table, df: DataFrame) -> None:
+    """executemany on the DBAPI cursor in batches of `ingest_batch_size`.
+
+    Rows are sent as tuples of Python scalars built column by column, the
+    per row parameter processing of a Core insert costs more than the insert.
+    """
+    conn = db.connection()
+    dialect = conn.dialect
+    compiled = table.insert().compile(dialect=dialect, column_keys=list(df.columns))
+    keys = compiled.positiontup if dialect.positional else list(df.columns)
+    columns = [
+        driver_values(df[key], bind_processor(table.c[key].type, df[key], dialect))
+        for key in keys
+    ]
+
+    batch_size = get_config().get("ingest_batch_size", 50000)
+    with metrics.phase("db"):
+        for start in range(0, len(df), batch_size):
+            rows = zip(*[col[start : start + batch_size] for col in columns])
+            if dialect.positional:
+                params = list(rows)
+            else:
+                params = [dict(zip(keys, row)) for row in rows]
+            conn.exec_driver_sql(str(compiled), params)
+
+
+def bind_processor(column_type, values: pd.Series, dialect) -> Optional[Callable]:
+    """Bind processor of the column type, DateTime's for datetime values so
+    DATE columns store them the way crud binds its range ends."""
+    if values.dtype.kind == "M":
+        column_type = DateTime()
+    return column_type.dialect_impl(dialect).bind_processor(dialect)
+
+
+def driver_values(values: pd.Series, processor: Callable = None) -> list:
+    """Column as a list the driver binds, NaN as None, with the type's bind processor."""
+    if values.dtype.kind == "M":
+        out = list(values.dt.to_pydatetime())
+    elif values.dtype.kind == "f":
+        out = values.to_numpy().astype(object)
+        out[values.isna().to_numpy()] = None
+        out = out.tolist()
+    else:
+        out = values.tolist()
+
+    if processor is not None:
+        out = [processor(value) for value in out]
+    return out
+
+
+def touches(systems: Set[int], first: date, last: date) -> Callable[[Hashable], bool]:
+    """Cache keys (endpoint, sys_id, col, agg, start, end) overlapping the days."""
+    first = datetime.combine(first, time())
+    last = datetime.combine(last, time())
+
+    def match(key: Hashable) -> bool:
+        _, sys_id, *_, start, end = key
+        ids = set(sys_id) if isinstance(sys_id, tuple) else {sys_id}
+        return (sys_id is None or bool(ids & systems)) and start <= last and first < end
+
+    return match
+
+
+def invalidate(db: Session, systems: Set[int], first: date, last: date) -> int:
+    """Drop cached frames and recompute rollup months and statistics of the days.
+
+    Only this worker's state is touched, the others pick the days up at
+    their next `sync`.
+    """
+    systems = {int(system_id) for system_id in systems}
+    invalidated = cache.responses.invalidate(touches(systems, first, last))
+    rollups.update(db, sorted(systems), first, last)
+    stats.comparisons.update(db, first)
+
+    return invalidated
+
+
+def synced(dates: List[date]) -> Optional[Tuple[int, ...]]:
+    """Rows of the months overlapping the range at the last `sync`, None before it."""
+    if synced_months is None:
+        return None
+    return tuple(
+        count
+        for month, count in sorted(synced_months.items())
+        if datetime.combine(month, time()) < dates[1]
+        and dates[0] < datetime.combine(month + relativedelta(months=1), time())
+    )
+
+
+def sync(db: Session) -> int:
+    """Invalidate the months of performances written since the last sync, by
+    other workers or outside /ingest, returns the dropped cache entries.
+
+    The first call only takes the snapshot of rows per month.
+    """
+    global synced_months
+    months = crud.perfs_months(db)
+    previous, synced_months = synced_months, months
+    changed = previous is not None and functions.first_change(previous, months)
+    if not changed:
+        return 0
+
+    last = max(previous.keys() | months.keys()) + relativedelta(months=1)
+    systems = set(crud.get_sys_ids(db))
+    return invalidate(db, systems, changed, last - timedelta(days=1))
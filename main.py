@@ -1,29 +1,79 @@
 from sqlalchemy.orm import Session
-from fastapi import Depends, FastAPI
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import OperationalError
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict, List, Optional
-import pandas
-
-from database import SessionLocal
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from datetime import date, datetime
+from contextlib import asynccontextmanager
+from pandas import DataFrame, Timestamp
+import asyncio
+import hmac
+
+from database import (
+    AsyncReadSessionLocal,
+    AsyncSessionLocal,
+    ReadSessionLocal,
+    SessionLocal,
+    get_config,
+    pool_stats,
+    run,
+)
+import admission
+import cache
+import compression
 import crud
 import functions
+import ingest
+import metrics
+import responses
+import rollups
+import stats
+import warming
 from enums import (
     Inverters,
+    Downsamplings,
+    Intervals,
+    Statistics,
     Aggregations,
     Yields,
     Comparations,
     Efficiencies,
     Energies,
+    Ingestions,
     PerformanceRatios,
+    Totals,
 )
 
 # Dependency
-def get_db():
+async def get_db():
+    """Read only session, on a replica when `replicas` are configured."""
+    if get_config().get("async", False):
+        async with AsyncReadSessionLocal() as db:
+            yield db
+        return
+
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        await run_in_threadpool(db.close)
+
+
+async def get_write_db():
+    """Session on the primary."""
+    if get_config().get("async", False):
+        async with AsyncSessionLocal() as db:
+            yield db
+        return
+
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        await run_in_threadpool(db.close)
 
 
 description = """
@@ -59,10 +109,34 @@ PV-Platform API helps retrieve the monitoring and performance metrics of systems
 - **start_dt**:    Start date (format: YYYY-mm-dd)
 - **end_dt**:      End date (format: YYYY-mm-dd)
 - **agg**:         Data Aggregation type, e.g. date, month or year
+- **max_points**:  Maximum number of points of a minute series, e.g. the chart width
+- **method**:      Downsampling method, lttb or min-max
+- **interval**:    Resampling interval of a minute series, e.g. 5min, 15min, 30min or hour
+- **stat**:        Statistic of each resampled bucket, e.g. mean, min, max or min-max
+- **stream**:      Stream a minute series as NDJSON chunks of x and y lists
+- **limit**:       Page size of a minute series, pages are chained by their `next` cursor
+- **after**:       Cursor of a minute series page, e.g. 2021-05-01T10:59:00
+
+## Formats
+
+Time series and aggregated endpoints answer JSON by default. Send an `Accept` header to get:
+
+- `application/vnd.apache.arrow.stream`: Arrow IPC stream (requires pyarrow on the server)
+- `application/octet-stream`: little-endian int64 epoch milliseconds followed by one float64 block per column listed in `X-Columns`, `X-Count` points each
+- `application/vnd.pv-platform.compact+json`: JSON with floats rounded to `compact_precision` decimals and regular time axes as `{"start", "step", "count", "gaps"}`, where `step` is in seconds, `count` the number of steps from `start` and `gaps` the `[step, length]` runs of missing steps
+
+`/comparison` and `/systems` keep their nested JSON by default, other formats get one row per location and technology, or per system and day with a `system_id` column. `/comparison` has no time axis and no `application/octet-stream` form.
+
+Bodies over `compression_min_size` bytes are compressed with zstd, brotli or gzip, the first of `compression` the `Accept-Encoding` header allows.
 
 """
 
-app = FastAPI(title="PV-Platform API", description=description, version="0.11.2")
+app = FastAPI(
+    title="PV-Platform API",
+    description=description,
+    version="0.11.2",
+    default_response_class=responses.ORJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -71,26 +145,86 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(compression.CompressionMiddleware)
+app.add_middleware(admission.AdmissionMiddleware)
+app.add_middleware(metrics.TimingMiddleware)
+
+
+@app.exception_handler(OperationalError)
+async def statement_timeout_handler(request: Request, exc: OperationalError):
+    if not admission.is_timeout(exc):
+        raise exc
+    admission.decisions.inc(1, "timeout")
+    return responses.ORJSONResponse(
+        {"detail": "Query exceeded statement_timeout, narrow the range"},
+        status_code=503,
+        headers={"X-Admission": "timeout"},
+    )
+
+
+@app.on_event("startup")
+async def start_warming():
+    config = get_config()
+    schedule = config.get("warm_schedule")
+    if not schedule:
+        return
+
+    async def warm_views() -> None:
+        async with asynccontextmanager(get_db)() as db:
+            system_ids = await run(db, crud.get_sys_ids)
+        paths = warming.expand(
+            config.get("warm_paths", warming.DEFAULT_PATHS),
+            system_ids,
+            config.get("warm_days", 30),
+        )
+        await warming.warm(app, paths, config.get("warm_concurrency", 2))
+
+    app.state.warming = asyncio.ensure_future(
+        warming.run_forever(warming.Cron(schedule), warm_views)
+    )
+
+
+@app.on_event("startup")
+async def start_sync():
+    schedule = get_config().get("sync_schedule", "*/5 * * * *")
+    if not schedule:
+        return
+
+    async def sync_performances() -> None:
+        async with asynccontextmanager(get_db)() as db:
+            await run(db, ingest.sync)
+
+    app.state.sync = asyncio.ensure_future(
+        warming.run_forever(warming.Cron(schedule), sync_performances)
+    )
+
+
+@app.on_event("shutdown")
+async def stop_schedules():
+    for name in ["warming", "sync"]:
+        task = getattr(app.state, name, None)
+        if task is not None:
+            task.cancel()
 
 
 @app.get("/")
-def main():
+async def main():
     return "PV Platform API"
 
 
 @app.get("/locations", tags=["Description"])
-def get_locations(db: Session = Depends(get_db)) -> List[Dict[str, str]]:
+async def get_locations(db: Session = Depends(get_db)) -> List[Dict[str, str]]:
     """
     Read the available locations in the Database.
 
     Returns:
     - List[Dict[str, str]]: Dictionaries with location_id and label keys.
     """
-    return crud.get_locs(db)
+    return responses.ORJSONResponse(await run(db, crud.get_locs))
 
 
 @app.get("/location/{loc_id}/systems", tags=["Description"])
-def get_systems_by_location(
+async def get_systems_by_location(
     loc_id: int, db: Session = Depends(get_db)
 ) -> List[Dict[str, int]]:
     """Read systems available in the requested location.
@@ -101,11 +235,11 @@ def get_systems_by_location(
     Returns:
     - List[Dict[str, int]]: dictionaries with location_id, system_id and technology of each system.
     """
-    return crud.get_sys(db, loc_id)
+    return responses.ORJSONResponse(await run(db, crud.get_sys, loc_id))
 
 
 @app.get("/location/{loc_id}/system/{sys_id}", tags=["Description"])
-def get_system_information(
+async def get_system_information(
     loc_id: int, sys_id: int, db: Session = Depends(get_db)
 ) -> List[List[Dict[str, float]]]:
     """
@@ -118,12 +252,26 @@ def get_system_information(
     Returns:
     - List[List[Dict[str, float]]]: System and module list of information dictionaries.
     """
-    return crud.get_sys_info(db, sys_id), crud.get_tech_info(db, sys_id)
+    sys_info = await run(db, crud.get_sys_info, sys_id)
+    tech_info = await run(db, crud.get_tech_info, sys_id)
+
+    return responses.ORJSONResponse([sys_info, tech_info])
 
 
 @app.get("/ambient/irr/{loc_id}/{start_dt}", tags=["Ambient"])
-def get_irradiance(
-    loc_id: int, start_dt: str, end_dt: str = None, db: Session = Depends(get_db)
+async def get_irradiance(
+    request: Request,
+    loc_id: int,
+    start_dt: str,
+    end_dt: str = None,
+    max_points: Optional[int] = Query(None, ge=3),
+    method: Downsamplings = Downsamplings.lttb,
+    interval: Optional[Intervals] = None,
+    stat: Statistics = Statistics.mean,
+    stream: bool = False,
+    limit: Optional[int] = Query(None, ge=1, le=100000),
+    after: Optional[datetime] = None,
+    db: Session = Depends(get_db),
 ) -> Dict[str, List[float]]:
     """Get Irradiance from database.
 
@@ -131,6 +279,13 @@ def get_irradiance(
     - loc_id (int): Location ID.
     - start_dt (str): Start date.
     - end_dt (str, optional): End date. Defaults to None.
+    - max_points (int, optional): Downsample to this number of points. Defaults to None.
+    - method (Downsamplings, optional): Downsampling method. Defaults to Downsamplings.lttb.
+    - interval (Intervals, optional): Resample to 5, 15 or 30 minutes or hourly buckets, max_points is then ignored. Defaults to None.
+    - stat (Statistics, optional): Statistic of each bucket, min-max returns y_min and y_max. Defaults to Statistics.mean.
+    - stream (bool, optional): Stream NDJSON chunks, ignored with max_points or interval. Defaults to False.
+    - limit (int, optional): Return raw points by pages of this size, with the cursor of the following page in `next`. Defaults to None.
+    - after (datetime, optional): Cursor of the page to return, the `next` of the previous one. Defaults to None.
 
     Returns:
     - Dict[str, List[float]]: Measurements on a minute basis.
@@ -139,12 +294,48 @@ def get_irradiance(
     dates = functions.sort_dates(dates)
     dates = functions.set_dates_range(dates)
 
-    return crud.get_irrs(db, loc_id, dates)
+    series = crud.irrs_series(loc_id)
+    if limit is not None:
+        return await page_response(request, db, series, dates, after, limit)
+
+    current, headers, _ = await revalidate(
+        request, db, dates, crud.series_watermark, series, dates
+    )
+    if current:
+        return current
+
+    if stream and max_points is None and interval is None:
+        return stream_response(db, series, dates, headers)
+
+    with metrics.phase("transform"):
+        df = await run(
+            db,
+            crud.get_irrs,
+            loc_id,
+            dates,
+            max_points,
+            method.value,
+            interval and interval.name,
+            stat.value,
+        )
+
+    return await run_in_threadpool(responses.render, request, df, headers)
 
 
 @app.get("/ambient/t_mod/{sys_id}/{start_dt}", tags=["Ambient"])
-def get_module_temperature(
-    sys_id: int, start_dt: str, end_dt: str = None, db: Session = Depends(get_db)
+async def get_module_temperature(
+    request: Request,
+    sys_id: int,
+    start_dt: str,
+    end_dt: str = None,
+    max_points: Optional[int] = Query(None, ge=3),
+    method: Downsamplings = Downsamplings.lttb,
+    interval: Optional[Intervals] = None,
+    stat: Statistics = Statistics.mean,
+    stream: bool = False,
+    limit: Optional[int] = Query(None, ge=1, le=100000),
+    after: Optional[datetime] = None,
+    db: Session = Depends(get_db),
 ) -> Dict[str, List[float]]:
     """Get module temperature of a system.
 
@@ -152,6 +343,13 @@ def get_module_temperature(
     - sys_id (int): System ID.
     - start_dt (str): Start date.
     - end_dt (str, optional): End date. Defaults to None.
+    - max_points (int, optional): Downsample to this number of points. Defaults to None.
+    - method (Downsamplings, optional): Downsampling method. Defaults to Downsamplings.lttb.
+    - interval (Intervals, optional): Resample to 5, 15 or 30 minutes or hourly buckets, max_points is then ignored. Defaults to None.
+    - stat (Statistics, optional): Statistic of each bucket, min-max returns y_min and y_max. Defaults to Statistics.mean.
+    - stream (bool, optional): Stream NDJSON chunks, ignored with max_points or interval. Defaults to False.
+    - limit (int, optional): Return raw points by pages of this size, with the cursor of the following page in `next`. Defaults to None.
+    - after (datetime, optional): Cursor of the page to return, the `next` of the previous one. Defaults to None.
 
     Returns:
     - Dict[str, List[float]]: Module temperature on a minute basis.
@@ -160,15 +358,48 @@ def get_module_temperature(
     dates = functions.sort_dates(dates)
     dates = functions.set_dates_range(dates)
 
-    return crud.get_temps(db, sys_id, dates)
+    series = crud.temps_series(sys_id)
+    if limit is not None:
+        return await page_response(request, db, series, dates, after, limit)
+
+    current, headers, _ = await revalidate(
+        request, db, dates, crud.series_watermark, series, dates
+    )
+    if current:
+        return current
+
+    if stream and max_points is None and interval is None:
+        return stream_response(db, series, dates, headers)
+
+    with metrics.phase("transform"):
+        df = await run(
+            db,
+            crud.get_temps,
+            sys_id,
+            dates,
+            max_points,
+            method.value,
+            interval and interval.name,
+            stat.value,
+        )
+
+    return await run_in_threadpool(responses.render, request, df, headers)
 
 
 @app.get("/inverter/{col}/{sys_id}/{start_dt}", tags=["Inverter"])
-def get_system_output(
+async def get_system_output(
+    request: Request,
     sys_id: int,
     col: Inverters,
     start_dt: str,
     end_dt: str = None,
+    max_points: Optional[int] = Query(None, ge=3),
+    method: Downsamplings = Downsamplings.lttb,
+    interval: Optional[Intervals] = None,
+    stat: Statistics = Statistics.mean,
+    stream: bool = False,
+    limit: Optional[int] = Query(None, ge=1, le=100000),
+    after: Optional[datetime] = None,
     db: Session = Depends(get_db),
 ) -> Dict[str, List[float]]:
     """Get array or system electrical output.
@@ -179,6 +410,13 @@ def get_system_output(
     - col (Inverters): Electrical output selection.
     - start_dt (str): Start date.
     - end_dt (str, optional): End date. Defaults to None.
+    - max_points (int, optional): Downsample to this number of points. Defaults to None.
+    - method (Downsamplings, optional): Downsampling method. Defaults to Downsamplings.lttb.
+    - interval (Intervals, optional): Resample to 5, 15 or 30 minutes or hourly buckets, max_points is then ignored. Defaults to None.
+    - stat (Statistics, optional): Statistic of each bucket, min-max returns y_min and y_max. Defaults to Statistics.mean.
+    - stream (bool, optional): Stream NDJSON chunks, ignored with max_points or interval. Defaults to False.
+    - limit (int, optional): Return raw points by pages of this size, with the cursor of the following page in `next`. Defaults to None.
+    - after (datetime, optional): Cursor of the page to return, the `next` of the previous one. Defaults to None.
 
     Returns:
     - Dict[str, List[float]]: Array or System electrical output on a minute basis.
@@ -187,11 +425,78 @@ def get_system_output(
     dates = functions.sort_dates(dates)
     dates = functions.set_dates_range(dates)
 
-    return crud.get_invs(db, sys_id, col.name, dates)
+    series = crud.invs_series(sys_id, col.name)
+    if limit is not None:
+        return await page_response(request, db, series, dates, after, limit)
+
+    current, headers, _ = await revalidate(
+        request, db, dates, crud.series_watermark, series, dates
+    )
+    if current:
+        return current
+
+    if stream and max_points is None and interval is None:
+        return stream_response(db, series, dates, headers)
+
+    with metrics.phase("transform"):
+        df = await run(
+            db,
+            crud.get_invs,
+            sys_id,
+            col.name,
+            dates,
+            max_points,
+            method.value,
+            interval and interval.name,
+            stat.value,
+        )
+
+    return await run_in_threadpool(responses.render, request, df, headers)
+
+
+@app.get("/timeline/{sys_id}/{start_dt}", tags=["Timeline"])
+async def get_timeline(
+    request: Request,
+    sys_id: int,
+    start_dt: str,
+    end_dt: str = None,
+    interval: Optional[Intervals] = None,
+    stat: Statistics = Statistics.mean,
+    db: Session = Depends(get_db),
+) -> Dict[str, List[float]]:
+    """Get irradiance, module temperature and inverter signals of a system on one time axis.
+
+    Args:
+    - sys_id (int): System ID.
+    - start_dt (str): Start date.
+    - end_dt (str, optional): End date. Defaults to None.
+    - interval (Intervals, optional): Resample to 5, 15 or 30 minutes or hourly buckets. Defaults to None.
+    - stat (Statistics, optional): Statistic of each bucket, min-max returns <signal>_min and <signal>_max. Defaults to Statistics.mean.
+
+    Returns:
+    - Dict[str, List[float]]: x, irradiance, t_mod, voltage_dc, current_dc, power_dc and power_ac on a minute basis.
+    """
+    dates = functions.format_dates(start_dt, end_dt)
+    dates = functions.sort_dates(dates)
+    dates = functions.set_dates_range(dates)
+
+    current, headers, _ = await revalidate(
+        request, db, dates, crud.timeline_watermark, sys_id, dates
+    )
+    if current:
+        return current
+
+    with metrics.phase("transform"):
+        df = await run(
+            db, crud.get_timeline, sys_id, dates, interval and interval.name, stat.value
+        )
+
+    return await run_in_threadpool(responses.render, request, df, headers)
 
 
 @app.get("/yield/{col}/{sys_id}/{start_dt}", tags=["Yield"])
-def get_yield(
+async def get_yield(
+    request: Request,
     sys_id: int,
     col: Yields,
     start_dt: str,
@@ -215,19 +520,26 @@ def get_yield(
     dates = functions.sort_dates(dates)
     dates = functions.set_dates_range(dates, mode=agg.value)
 
-    yields = crud.get_perfs(db, sys_id, col.name, dates)
+    current, headers, mark = await revalidate(
+        request, db, dates, perfs_watermark, sys_id, dates
+    )
+    if current:
+        return current
+
+    key = ("yield", sys_id, col.name, agg.name, mark, *dates)
     try:
-        df = functions.groupby(yields, freq=agg.name)
-        df.rename({"date": "x", col.name: "y"}, axis=1, inplace=True)
-        df = df[df["y"] > 0]
+        df = await cached(
+            db, key, dates, totals_frame, sys_id, col.name, dates, agg.name
+        )
     except ValueError:
         return {}
 
-    return df.to_dict("list")
+    return await run_in_threadpool(responses.render, request, df, headers)
 
 
 @app.get("/performance-ratio/{col}/{sys_id}/{start_dt}", tags=["Performance ratio"])
-def get_performance_ratio(
+async def get_performance_ratio(
+    request: Request,
     col: PerformanceRatios,
     sys_id: int,
     start_dt: str,
@@ -251,34 +563,26 @@ def get_performance_ratio(
     dates = functions.sort_dates(dates)
     dates = functions.set_dates_range(dates, mode=agg.value)
 
-    yield_name = col.name
-
-    yield_col = crud.get_perfs(db, sys_id, yield_name, dates)
-    yield_reference = crud.get_perfs(db, sys_id, "yield_reference", dates)
-
-    yields = pandas.merge(yield_col, yield_reference, on="date")
-    yields.columns = ["date", yield_name, "reference"]
-    yields[[yield_name, "reference"]] = yields[[yield_name, "reference"]].astype(
-        "float"
+    current, headers, mark = await revalidate(
+        request, db, dates, perfs_watermark, sys_id, dates
     )
+    if current:
+        return current
 
+    key = ("performance-ratio", sys_id, col.name, agg.name, mark, *dates)
     try:
-        df = functions.groupby(yields, freq=agg.name)
-        df["performance_ratio"] = df[yield_name] / df["reference"]
-        df.rename({"performance_ratio": "y", "date": "x"}, axis=1, inplace=True)
-        df = df[df["y"] > 0]
-        df.dropna(inplace=True)
+        df = await cached(
+            db, key, dates, performance_ratio_frame, sys_id, col.name, dates, agg.name
+        )
     except ValueError:
         return {}
 
-    try:
-        return df[["x", "y", "text"]].to_dict("list")
-    except:
-        return df[["x", "y"]].to_dict("list")
+    return await run_in_threadpool(responses.render, request, df, headers)
 
 
 @app.get("/efficiency/inverter/{sys_id}/{start_dt}", tags=["Efficiency"])
-def get_inverter_efficiency(
+async def get_inverter_efficiency(
+    request: Request,
     sys_id: int,
     start_dt: str,
     end_dt: Optional[str] = None,
@@ -300,31 +604,26 @@ def get_inverter_efficiency(
     dates = functions.sort_dates(dates)
     dates = functions.set_dates_range(dates, agg.value)
 
-    energy_dc = crud.get_perfs(db, sys_id, "energy_dc", dates)
-    energy_ac = crud.get_perfs(db, sys_id, "energy_ac", dates)
-
-    energy = pandas.merge(energy_dc, energy_ac, on="date")
-    energy.columns = ["date", "dc", "ac"]
-    energy[["dc", "ac"]] = energy[["dc", "ac"]].astype(float)
+    current, headers, mark = await revalidate(
+        request, db, dates, perfs_watermark, sys_id, dates
+    )
+    if current:
+        return current
 
+    key = ("efficiency", sys_id, "efficiency_inverter", agg.name, mark, *dates)
     try:
-        df = functions.groupby(energy, freq=agg.name)
-
-        df["efficiency_inverter"] = df["ac"] / df["dc"] * 100
-        df.rename({"efficiency_inverter": "y", "date": "x"}, axis=1, inplace=True)
-        df = df[df["y"] > 0]
-        df.dropna(inplace=True)
+        df = await cached(
+            db, key, dates, inverter_efficiency_frame, sys_id, dates, agg.name
+        )
     except ValueError:
         return {}
 
-    try:
-        return df[["x", "y", "text"]].to_dict("list")
-    except:
-        return df[["x", "y"]].to_dict("list")
+    return await run_in_threadpool(responses.render, request, df, headers)
 
 
 @app.get("/efficiency/{col}/{sys_id}/{start_dt}", tags=["Efficiency"])
-def get_efficiency(
+async def get_efficiency(
+    request: Request,
     col: Efficiencies,
     sys_id: int,
     start_dt: str,
@@ -348,32 +647,26 @@ def get_efficiency(
     dates = functions.sort_dates(dates)
     dates = functions.set_dates_range(dates, agg.value)
 
-    energy = crud.get_perfs(db, sys_id, col.name, dates)
-    yield_reference = crud.get_perfs(db, sys_id, "yield_reference", dates)
-    system_area = float(crud.system_area(db, sys_id))
-
-    df = pandas.merge(energy, yield_reference, on="date")
-    df.columns = ["date", "energy", "reference"]
-    df[["energy", "reference"]] = df[["energy", "reference"]].astype("float")
+    current, headers, mark = await revalidate(
+        request, db, dates, perfs_watermark, sys_id, dates
+    )
+    if current:
+        return current
 
+    key = ("efficiency", sys_id, col.name, agg.name, mark, *dates)
     try:
-        df = functions.groupby(df, freq=agg.name)
-
-        df["efficiency"] = (df["energy"] * 100) / (df["reference"] * system_area)
-        df.rename({"efficiency": "y", "date": "x"}, axis=1, inplace=True)
-        df = df[df["y"] > 0]
-        df.dropna(inplace=True)
+        df = await cached(
+            db, key, dates, efficiency_frame, sys_id, col.name, dates, agg.name
+        )
     except ValueError:
         return {}
 
-    try:
-        return df[["x", "y", "text"]].to_dict("list")
-    except:
-        return df[["x", "y"]].to_dict("list")
+    return await run_in_threadpool(responses.render, request, df, headers)
 
 
 @app.get("/energy/{col}/{sys_id}/{start_dt}", tags=["Energy"])
-def get_energy(
+async def get_energy(
+    request: Request,
     col: Energies,
     sys_id: int,
     start_dt: str,
@@ -397,21 +690,30 @@ def get_energy(
     dates = functions.sort_dates(dates)
     dates = functions.set_dates_range(dates, agg.value)
 
-    energy = crud.get_perfs(db, sys_id, col.name, dates)
+    current, headers, mark = await revalidate(
+        request, db, dates, perfs_watermark, sys_id, dates
+    )
+    if current:
+        return current
 
+    key = ("energy", sys_id, col.name, agg.name, mark, *dates)
     try:
-        df = functions.groupby(energy, freq=agg.name)
-        df.rename({"date": "x", col.name: "y"}, axis=1, inplace=True)
-        df = df[df["y"] > 0]
+        df = await cached(
+            db, key, dates, totals_frame, sys_id, col.name, dates, agg.name
+        )
     except ValueError:
         return {}
 
-    return df.to_dict("list")
+    return await run_in_threadpool(responses.render, request, df, headers)
 
 
 @app.get("/comparison/{col}/{start_dt}/{end_dt}/", tags=["Comparison"])
-def get_comparation(
-    col: Comparations, start_dt: str, end_dt: str, db: Session = Depends(get_db)
+async def get_comparation(
+    request: Request,
+    col: Comparations,
+    start_dt: str,
+    end_dt: str,
+    db: Session = Depends(get_db),
 ) -> Dict[str, List[float]]:
     """Get system comparations.
 
@@ -421,16 +723,348 @@ def get_comparation(
     - end_dt (str): End date.
 
     Returns:
-    - Dict[str, List[float]]: System performance metric and confidence level.
+    - Dict[str, List[float]]: System performance metric and confidence level by location, other formats have one row per location and technology.
     """
 
     dates = functions.format_dates(start_dt, end_dt)
     dates = functions.sort_dates(dates)
     dates = functions.set_dates_range(dates)
 
-    rslt = crud.get_perfs_cmp(db, col.name, dates)
-    rslt.fillna("null", inplace=True)
+    # Dropped by ingest.invalidate when days are written here or found by the sync
+    key = ("comparison", None, col.name, "D", None, *dates)
+    rslt = await cached(db, key, dates, comparison_frame, col.name, dates)
+
+    if responses.negotiate(request, responses.TABLES) != responses.JSON:
+        return await run_in_threadpool(
+            responses.render,
+            request,
+            rslt,
+            {"Vary": "Accept"},
+            supported=responses.TABLES,
+        )
+
+    dct = functions.format_comparison(rslt.fillna("null"))
+
+    return responses.ORJSONResponse(dct, headers={"Vary": "Accept"})
+
+
+@app.get("/systems/{col}/{start_dt}", tags=["Batch"])
+async def get_systems_totals(
+    request: Request,
+    col: Totals,
+    start_dt: str,
+    end_dt: Optional[str] = None,
+    agg: Aggregations = Aggregations.D,
+    sys_ids: Optional[List[int]] = Query(None),
+    db: Session = Depends(get_db),
+) -> Dict[int, Dict[str, List[float]]]:
+    """Get yield or energy of several systems in one call.
+
+    Args:
+    - col (Totals): Yield or energy selection.
+    - start_dt (str): Start date.
+    - end_dt (Optional[str], optional): End date. Defaults to None.
+    - agg (Aggregations, optional): Aggregation selection. Defaults to Aggregations.D.
+    - sys_ids (Optional[List[int]], optional): System IDs, repeat the parameter for each one. Defaults to all systems.
+
+    Returns:
+    - Dict[int, Dict[str, List[float]]]: Yield or energy of each system, other formats have a system_id column.
+    """
+    dates = functions.format_dates(start_dt, end_dt)
+    dates = functions.sort_dates(dates)
+    dates = functions.set_dates_range(dates, agg.value)
+
+    sys_ids = sorted(set(sys_ids)) if sys_ids else await run(db, crud.get_sys_ids)
+
+    mark = await run(db, perfs_watermark, sys_ids, dates)
+    key = ("systems", tuple(sys_ids), col.name, agg.name, mark, *dates)
+    df = await cached(
+        db, key, dates, systems_totals_frame, sys_ids, col.name, dates, agg.name
+    )
+
+    if responses.negotiate(request) != responses.JSON:
+        return await run_in_threadpool(
+            responses.render, request, df, {"Vary": "Accept"}
+        )
+
+    frames = functions.split_systems(df, sys_ids)
+
+    return responses.ORJSONResponse(
+        {system_id: responses.columns(frame) for system_id, frame in frames.items()},
+        headers={"Vary": "Accept"},
+    )
+
+
+@app.post("/ingest/{table}", tags=["Ingest"])
+async def ingest_rows(
+    request: Request,
+    table: Ingestions,
+    x_ingest_token: Optional[str] = Header(None),
+    db: Session = Depends(get_write_db),
+) -> Dict[str, float]:
+    """Insert a batch of rows, skipping the ones already stored.
+
+    The body is CSV, NDJSON or an Arrow IPC stream, told by the Content-Type header.
+    Minute tables need a `datetime` column, performances a `date` column, plus
+    `system_id` (`location_id` for irradiances) and any value columns of the table.
+
+    Args:
+    - table (Ingestions): Table to insert into.
+    - x_ingest_token (str): Must match `ingest_token` in config.json.
+
+    Returns:
+    - Dict[str, float]: Received, inserted, duplicate and invalidated counts, and rows/s.
+    """
+    token = get_config().get("ingest_token")
+    if not token:
+        raise HTTPException(status_code=403, detail="Ingestion is disabled")
+    if not hmac.compare_digest(x_ingest_token or "", token):
+        raise HTTPException(status_code=401, detail="Invalid ingest token")
+
+    body = await request.body()
+    media_type = request.headers.get("content-type", "").split(";")[0].strip()
+    try:
+        df = await run_in_threadpool(ingest.parse, body, media_type)
+        return await run(db, ingest.ingest, table.value, df)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@app.get("/cache", tags=["Monitoring"])
+async def get_cache_stats() -> Dict[str, int]:
+    """Get response cache and request coalescing counters.
+
+    Returns:
+    - Dict[str, int]: Entries, bytes, hits, misses, evictions, in flight, leaders and coalesced.
+    """
+    return {**cache.responses.stats(), **cache.flights.stats()}
+
+
+@app.get("/pools", tags=["Monitoring"])
+async def get_pools() -> List[Dict[str, Union[str, int, bool]]]:
+    """Get connection pool statistics of the primary and of every replica.
+
+    Returns:
+    - List[Dict[str, Union[str, int, bool]]]: Engine, URL, health, sessions served and pool size, checked in, checked out and overflow.
+    """
+    return pool_stats()
+
+
+@app.get("/metrics", tags=["Monitoring"], response_class=PlainTextResponse)
+async def get_metrics() -> str:
+    """Get request, phase and pool checkout histograms in Prometheus text format.
+
+    Returns:
+    - str: Prometheus exposition.
+    """
+    return PlainTextResponse(
+        metrics.exposition(), media_type="text/plain; version=0.0.4"
+    )
+
+
+def stream_response(
+    db: Union[Session, AsyncSession],
+    series: Tuple[str, int, Callable],
+    dates: List[date],
+    headers: Dict[str, str] = None,
+) -> StreamingResponse:
+    if isinstance(db, AsyncSession):
+        chunks = crud.astream_series(db, series, dates)
+    else:
+        chunks = crud.stream_series(db, series, dates)
+
+    return StreamingResponse(chunks, media_type="application/x-ndjson", headers=headers)
+
+
+async def page_response(
+    request: Request,
+    db: Union[Session, AsyncSession],
+    series: Tuple[str, int, Callable],
+    dates: List[date],
+    after: Optional[datetime],
+    limit: int,
+) -> Response:
+    """Page of a series with the cursor of the next one in `next` and a Link header.
+
+    The ETag is built from the page itself, its last point, size and cursor,
+    so a page costs the same whatever the length of the range.
+    """
+    try:
+        df, cursor = await run(db, crud.get_page, series, dates, after, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    last = Timestamp(df["x"].iloc[-1]).to_pydatetime() if len(df) else None
+    headers = responses.validators(request, (last, len(df), cursor), dates)
+    if responses.not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+
+    extra = {"next": cursor and cursor.isoformat()}
+    if cursor is not None:
+        url = request.url.include_query_params(after=cursor.isoformat())
+        headers = {**headers, "Link": f'<{url}>; rel="next"'}
+
+    return await run_in_threadpool(responses.render, request, df, headers, extra)
+
+
+async def revalidate(
+    request: Request,
+    db: Union[Session, AsyncSession],
+    dates: List[date],
+    watermark: Callable,
+    *args,
+) -> Tuple[Optional[Response], Dict[str, str], tuple]:
+    """Validators of the response from the data watermark, with a 304 response
+    when the client's copy is still current, before any frame is computed.
+
+    The watermark is returned too, cache keys include it so frames computed
+    before rows arrived outside /ingest are not served under the new ETag.
+    """
+    mark = await run(db, watermark, *args)
+    headers = responses.validators(request, mark, dates)
+    if responses.not_modified(request, headers):
+        return Response(status_code=304, headers=headers), headers, mark
+
+    return None, headers, mark
+
+
+def perfs_watermark(
+    db: Session, sys_id: Union[int, List[int]], dates: List[date]
+) -> tuple:
+    """Watermark of the systems' days in the range and the rows of its months at
+    the last sync, rollups see the days written by other workers once synced."""
+    return (*crud.perfs_watermark(db, sys_id, dates), ingest.synced(dates))
+
+
+async def cached(
+    db: Union[Session, AsyncSession],
+    key: Tuple,
+    dates: List[date],
+    compute: Callable,
+    *args,
+) -> DataFrame:
+    """Read a computed frame from the response cache or compute and store it.
+
+    Concurrent misses of the same key wait on a single computation. Cached
+    frames are shared between requests and must not be modified.
+    """
+    df = cache.responses.get(key)
+    if df is not None:
+        return df
+
+    async def compute_and_store() -> DataFrame:
+        # Time not spent in crud queries counts as transform
+        with metrics.phase("transform"):
+            df = await run(db, compute, *args)
+        cache.responses.set(key, df, dates)
+        return df
+
+    return await cache.flights.do(key, compute_and_store)
+
+
+def grouped_perfs(
+    db: Session, sys_id: int, cols: List[str], dates: List[date], freq: str
+) -> DataFrame:
+    """Sum performance columns by day, month or year, on days where all are valid.
+
+    Daily sums are grouped with pandas, month and year buckets are grouped in SQL.
+    """
+    if freq != "D":
+        rslt = grouped_buckets(db, sys_id, cols, dates, freq)
+        return functions.format_buckets(rslt, freq)
+
+    df = crud.get_perfs(db, sys_id, cols, dates)
+    df[cols] = df[cols].astype("float")
+
+    return functions.groupby(df, freq=freq)
+
+
+def grouped_buckets(
+    db: Session,
+    sys_id: Union[int, List[int]],
+    cols: List[str],
+    dates: List[date],
+    freq: str,
+) -> DataFrame:
+    """Month or year sums from the rollups when the range is month aligned."""
+    if get_config().get("rollups", True) and rollups.aligned(dates):
+        return rollups.grouped(db, sys_id, cols, dates, freq)
+
+    return crud.get_perfs_grouped(db, sys_id, cols, dates, freq)
+
+
+def totals_frame(
+    db: Session, sys_id: int, col: str, dates: List[date], freq: str
+) -> DataFrame:
+    df = grouped_perfs(db, sys_id, [col], dates, freq)
+    df.rename({"date": "x", col: "y"}, axis=1, inplace=True)
+    df = df[df["y"] > 0]
+
+    return df
+
+
+def systems_totals_frame(
+    db: Session, sys_ids: List[int], col: str, dates: List[date], freq: str
+) -> DataFrame:
+    if freq != "D":
+        rslt = grouped_buckets(db, sys_ids, [col], dates, freq)
+        df = functions.format_buckets(rslt, freq)
+    else:
+        df = crud.get_perfs(db, sys_ids, [col], dates)
+        df[col] = df[col].astype("float")
+        df = functions.groupby_systems(df)
+
+    df.rename({"date": "x", col: "y"}, axis=1, inplace=True)
+    df = df[df["y"] > 0]
+
+    return df
+
+
+def performance_ratio_frame(
+    db: Session, sys_id: int, yield_name: str, dates: List[date], freq: str
+) -> DataFrame:
+    df = grouped_perfs(db, sys_id, [yield_name, "yield_reference"], dates, freq)
+    df["performance_ratio"] = df[yield_name] / df["yield_reference"]
+    df.rename({"performance_ratio": "y", "date": "x"}, axis=1, inplace=True)
+    df = df[df["y"] > 0]
+    df.dropna(inplace=True)
+
+    columns = [col for col in ["x", "y", "text"] if col in df]
+    return df[columns]
+
+
+def inverter_efficiency_frame(
+    db: Session, sys_id: int, dates: List[date], freq: str
+) -> DataFrame:
+    df = grouped_perfs(db, sys_id, ["energy_dc", "energy_ac"], dates, freq)
+    df["efficiency_inverter"] = df["energy_ac"] / df["energy_dc"] * 100
+    df.rename({"efficiency_inverter": "y", "date": "x"}, axis=1, inplace=True)
+    df = df[df["y"] > 0]
+    df.dropna(inplace=True)
+
+    columns = [col for col in ["x", "y", "text"] if col in df]
+    return df[columns]
+
+
+def efficiency_frame(
+    db: Session, sys_id: int, col: str, dates: List[date], freq: str
+) -> DataFrame:
+    df = grouped_perfs(db, sys_id, [col, "yield_reference"], dates, freq)
+    system_area = float(crud.system_area(db, sys_id))
+
+    df["efficiency"] = (df[col] * 100) / (df["yield_reference"] * system_area)
+    df.rename({"efficiency": "y", "date": "x"}, axis=1, inplace=True)
+    df = df[df["y"] > 0]
+    df.dropna(inplace=True)
+
+    columns = [col for col in ["x", "y", "text"] if col in df]
+    return df[columns]
+
 
-    dct = functions.format_comparison(rslt)
+def comparison_frame(db: Session, col: str, dates: List[date]) -> DataFrame:
+    if get_config().get("stats_index", True):
+        rslt = stats.comparisons.comparison(db, col, dates)
+    else:
+        rslt = crud.get_perfs_cmp(db, col, dates)
 
-    return dct
+    return rslt
@@ -0,0 +1,216 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from starlette.datastructures import MutableHeaders
+from starlette.routing import Match
+from collections import defaultdict
+from time import perf_counter
+from typing import Callable, Dict, List, Tuple
+import bisect
+import threading
+
+BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+# Histograms and counters in creation order, wherever they are defined
+instruments = []
+
+
+class Timings:
+    """Exclusive duration of each phase of one request, nested phases pause the outer one."""
+
+    def __init__(self):
+        self.phases = defaultdict(float)
+        self.stack = []
+        self.rows = 0
+
+    def enter(self, name: str) -> None:
+        now = perf_counter()
+        if self.stack:
+            outer, start = self.stack[-1]
+            self.phases[outer] += now - start
+        self.stack.append([name, now])
+
+    def exit(self) -> None:
+        now = perf_counter()
+        name, start = self.stack.pop()
+        self.phases[name] += now - start
+        if self.stack:
+            self.stack[-1][1] = now
+
+    def header(self, total: float) -> str:
+        items = [
+            f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.phases.items()
+        ]
+        items.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(items)
+
+
+def label_pairs(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.series = {}
+        self.lock = threading.Lock()
+        instruments.append(self)
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self.lock:
+            counts = self.series.setdefault(labels, [0] * (len(BUCKETS) + 1) + [0.0])
+            counts[bisect.bisect_left(BUCKETS, value)] += 1
+            counts[-1] += value
+
+    def exposition(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for labels, counts in sorted(self.series.items()):
+                names = label_pairs(self.labels, labels)
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ["+Inf"], counts):
+                    cumulative += count
+                    le = ",".join(filter(None, [names, f'le="{bound}"']))
+                    lines.append(f"{self.name}_bucket{{{le}}} {cumulative}")
+                selector = f"{{{names}}}" if names else ""
+                lines.append(f"{self.name}_sum{selector} {counts[-1]}")
+                lines.append(f"{self.name}_count{selector} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.series = defaultdict(float)
+        self.lock = threading.Lock()
+        instruments.append(self)
+
+    def inc(self, value: float = 1, *labels: str) -> None:
+        with self.lock:
+            self.series[labels] += value
+
+    def exposition(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for labels, value in sorted(self.series.items()):
+                selector = f"{{{label_pairs(self.labels, labels)}}}" if labels else ""
+                lines.append(f"{self.name}{selector} {value}")
+        return lines
+
+
+requests = Histogram(
+    "pv_request_duration_seconds", "Request duration by route.", ("route",)
+)
+phases = Histogram(
+    "pv_phase_duration_seconds",
+    "Time spent per request phase (db, transform, serialize).",
+    ("route", "phase"),
+)
+rows = Counter("pv_rows_total", "Rows read from the database by route.", ("route",))
+pool_wait = Histogram(
+    "pv_pool_checkout_seconds", "Wait to check a connection out of the pool."
+)
+
+# name -> (type, help, callback returning the current value)
+collectors: Dict[str, Tuple[str, str, Callable[[], float]]] = {}
+
+_timings: ContextVar = ContextVar("timings", default=None)
+
+
+@contextmanager
+def phase(name: str):
+    """Time a block as a phase of the current request, a no-op outside requests."""
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+
+    timings.enter(name)
+    try:
+        yield
+    finally:
+        timings.exit()
+
+
+def add_rows(n: int) -> None:
+    timings = _timings.get()
+    if timings is not None:
+        timings.rows += n
+
+
+def register(name: str, kind: str, help: str, callback: Callable[[], float]) -> None:
+    """Expose a value owned by another module, e.g. cache counters, on /metrics."""
+    collectors[name] = (kind, help, callback)
+
+
+def instrument_pool(pool) -> None:
+    """Record how long each checkout waits on the pool, as a `pool` phase too."""
+    connect = pool.connect
+
+    def timed_connect():
+        start = perf_counter()
+        try:
+            return connect()
+        finally:
+            elapsed = perf_counter() - start
+            pool_wait.observe(elapsed)
+            timings = _timings.get()
+            if timings is not None:
+                timings.phases["pool"] += elapsed
+
+    pool.connect = timed_connect
+
+
+def exposition() -> str:
+    lines = []
+    for metric in instruments:
+        lines += metric.exposition()
+    for name, (kind, help, callback) in collectors.items():
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+        lines.append(f"{name} {callback()}")
+
+    return "\n".join(lines) + "\n"
+
+
+def route_name(scope) -> str:
+    """Path template of the matched route, keeps label cardinality bounded."""
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+class TimingMiddleware:
+    """Add a Server-Timing header and record the phases of each request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = Timings()
+        token = _timings.set(timings)
+        start = perf_counter()
+
+        async def send_timed(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", timings.header(perf_counter() - start))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            _timings.reset(token)
+            route = route_name(scope)
+            requests.observe(perf_counter() - start, route)
+            for name, seconds in timings.phases.items():
+                phases.observe(seconds, route, name)
+            rows.inc(timings.rows, route)
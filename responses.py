@@ -0,0 +1,261 @@
+from fastapi import Request, Response
+from pandas import DataFrame, to_datetime
+from datetime import date, datetime, time, timezone
+from decimal import Decimal
+from email.utils import format_datetime
+from typing import Any, Dict, List, Optional
+import hashlib
+import numpy as np
+import orjson
+
+from database import get_config
+import cache
+import metrics
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+JSON = "application/json"
+ARROW = "application/vnd.apache.arrow.stream"
+PACKED = "application/octet-stream"
+COMPACT = "application/vnd.pv-platform.compact+json"
+
+# Formats of frames without a time axis, packed needs one
+TABLES = [JSON, COMPACT] + ([ARROW] if pyarrow else [])
+
+
+def default(obj: Any) -> Any:
+    """Types orjson leaves to the caller: Decimal columns, Timestamps, NumPy scalars."""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    raise TypeError
+
+
+class ORJSONResponse(Response):
+    """JSON encoded by orjson, NumPy arrays are written without boxing their items.
+
+    Unlike FastAPI's JSONResponse the content is not walked by jsonable_encoder
+    when an endpoint returns this response itself.
+    """
+
+    media_type = JSON
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        )
+
+
+def columns(df: DataFrame) -> Dict[str, Any]:
+    """Frame columns ready for orjson, numbers stay NumPy arrays, NaN becomes null.
+
+    datetime64 columns are formatted in one call as YYYY-mm-ddTHH:MM:SS.
+    """
+    data = {}
+    for col in df.columns:
+        values = df[col].to_numpy()
+        if values.dtype.kind == "M":
+            data[col] = np.datetime_as_string(values, unit="s").tolist()
+        elif values.dtype.kind in "biuf":
+            data[col] = np.ascontiguousarray(values)
+        else:
+            data[col] = values.tolist()
+
+    return data
+
+
+def compact_axis(values: np.ndarray) -> Optional[Dict[str, Any]]:
+    """Regular time axis as start, step in seconds, slot count and the
+    [slot, length] runs of missing slots. None when the axis is irregular.
+    """
+    x = values.astype("datetime64[s]").astype("int64")
+    if len(x) < 2:
+        return None
+    diffs = np.diff(x)
+    step = int(diffs.min())
+    if step <= 0 or (diffs % step).any():
+        return None
+
+    slots = (x - x[0]) // step
+    holes = np.flatnonzero(diffs > step)
+    gaps = np.column_stack([slots[holes] + 1, diffs[holes] // step - 1])
+    return {
+        "start": np.datetime_as_string(values[0], unit="s"),
+        "step": step,
+        "count": int(slots[-1]) + 1,
+        "gaps": gaps,
+    }
+
+
+def compact_columns(df: DataFrame) -> Dict[str, Any]:
+    """Like `columns`, with `compact_axis` time axes and floats rounded to
+    `compact_precision` decimals.
+    """
+    precision = get_config().get("compact_precision", 3)
+    data = {}
+    for col in df.columns:
+        values = df[col].to_numpy()
+        if values.dtype.kind == "M":
+            data[col] = compact_axis(values)
+            if data[col] is None:
+                data[col] = np.datetime_as_string(values, unit="s").tolist()
+            continue
+        if values.dtype.kind == "O" and col != "text":
+            try:
+                values = values.astype("float")
+            except (TypeError, ValueError):
+                pass
+        if values.dtype.kind == "f":
+            data[col] = np.round(values, precision)
+        elif values.dtype.kind in "biu":
+            data[col] = np.ascontiguousarray(values)
+        else:
+            data[col] = values.tolist()
+
+    return data
+
+
+def negotiate(request: Request, supported: List[str] = None) -> str:
+    """Pick the first supported media type of the Accept header, JSON by default.
+
+    `supported` narrows the formats, e.g. to `TABLES` for frames without a time axis.
+    """
+    supported = supported or [JSON, COMPACT, PACKED] + ([ARROW] if pyarrow else [])
+
+    for item in request.headers.get("accept", JSON).split(","):
+        media_type, *params = [p.strip() for p in item.split(";")]
+        if "q=0" in params:
+            continue
+        if media_type in supported:
+            return media_type
+
+    return JSON
+
+
+def to_arrow(df: DataFrame) -> bytes:
+    table = pyarrow.Table.from_pandas(numeric(df), preserve_index=False)
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+    return sink.getvalue().to_pybytes()
+
+
+def to_packed(df: DataFrame) -> bytes:
+    """Little-endian int64 epoch milliseconds followed by one float64 block per column."""
+    df = numeric(df.drop(columns=[col for col in ["text"] if col in df]))
+    x = to_datetime(df["x"]).to_numpy(dtype="datetime64[ms]").astype("<i8")
+    ys = [df[col].to_numpy(dtype="<f8") for col in df.columns if col != "x"]
+
+    return b"".join(arr.tobytes() for arr in [x] + ys)
+
+
+def numeric(df: DataFrame) -> DataFrame:
+    """Cast the measurements, usually Decimal, to float64, labels stay strings."""
+    df = df.copy()
+    cols = [col for col in df.columns if col not in ["x", "text"]]
+    try:
+        df[cols] = df[cols].astype("float")
+    except (TypeError, ValueError):
+        for col in cols:
+            try:
+                df[col] = df[col].astype("float")
+            except (TypeError, ValueError):
+                pass
+
+    return df
+
+
+def validators(request: Request, watermark: tuple, dates: List[date]) -> Dict[str, str]:
+    """ETag of the URL, the negotiated format and the data watermark, and caching headers.
+
+    Historical ranges can be held by browsers and CDNs, the others are revalidated.
+    """
+    key = repr(
+        (
+            request.url.path,
+            sorted(request.query_params.multi_items()),
+            negotiate(request),
+            watermark,
+        )
+    )
+    headers = {
+        "ETag": f'W/"{hashlib.sha1(key.encode()).hexdigest()[:20]}"',
+        "Vary": "Accept",
+    }
+
+    latest = watermark[0]
+    if latest is not None:
+        if not isinstance(latest, datetime):
+            latest = datetime.combine(latest, time())
+        headers["Last-Modified"] = format_datetime(
+            latest.replace(tzinfo=timezone.utc), usegmt=True
+        )
+
+    # Yesterday's daily performances may still be loading
+    if cache.is_historical(dates, get_config().get("historical_delay_days", 1)):
+        max_age = get_config().get("historical_max_age", 86400)
+        headers["Cache-Control"] = f"public, max-age={max_age}"
+    else:
+        headers["Cache-Control"] = "no-cache"
+
+    return headers
+
+
+def not_modified(request: Request, headers: Dict[str, str]) -> bool:
+    """True when If-None-Match lists the current ETag, weak comparison."""
+    etags = request.headers.get("if-none-match")
+    if etags is None:
+        return False
+    if etags.strip() == "*":
+        return True
+
+    current = headers["ETag"].replace("W/", "")
+    return current in [etag.strip().replace("W/", "") for etag in etags.split(",")]
+
+
+def render(
+    request: Request,
+    df: DataFrame,
+    headers: Dict[str, str] = None,
+    extra: Dict[str, Any] = None,
+    supported: List[str] = None,
+) -> Response:
+    """Negotiated response of the frame, `extra` keys are added to JSON bodies."""
+    with metrics.phase("serialize"):
+        response = _render(request, df, extra, supported)
+    response.headers.update(headers or {})
+
+    return response
+
+
+def _render(
+    request: Request,
+    df: DataFrame,
+    extra: Dict[str, Any] = None,
+    supported: List[str] = None,
+) -> Response:
+    media_type = negotiate(request, supported)
+
+    if media_type == ARROW:
+        return Response(to_arrow(df), media_type=ARROW, headers={"Vary": "Accept"})
+    if media_type == PACKED:
+        headers = {
+            "Vary": "Accept",
+            "X-Columns": ",".join(col for col in df.columns if col != "text"),
+            "X-Count": str(len(df)),
+        }
+        return Response(to_packed(df), media_type=PACKED, headers=headers)
+    if media_type == COMPACT:
+        content = {**compact_columns(df), **(extra or {})}
+        return ORJSONResponse(content, media_type=COMPACT)
+
+    return ORJSONResponse({**columns(df), **(extra or {})})
@@ -0,0 +1,148 @@
+from sqlalchemy.orm import Session
+from pandas import DataFrame
+import pandas as pd
+from datetime import date, datetime, time
+from dateutil.relativedelta import relativedelta
+from typing import Dict, List, Tuple, Union
+import threading
+
+import crud
+
+
+class Rollup:
+    """Monthly sums and day counts of a set of columns for every system.
+
+    Like `crud.get_perfs_grouped` only days where all the columns are valid
+    are counted. Years are summed from their months. Built on first use,
+    months are recomputed by `update` from `ingest.invalidate`, for days
+    written here or found by `ingest.sync`, reads never query the database.
+    """
+
+    def __init__(self, cols: List[str]):
+        self.cols = cols
+        self.months = None
+        self.lock = threading.Lock()
+
+    def refresh(self, db: Session, since: date = None) -> None:
+        """Recompute the months from the one of `since` on, everything when None."""
+        with self.lock:
+            self._refresh(db, since)
+
+    def _refresh(self, db: Session, since: date = None) -> None:
+        if since is None or self.months is None:
+            start = date.min
+        else:
+            start = since.replace(day=1)
+
+        dates = [start, date.max]
+        fresh = crud.get_perfs_grouped(db, crud.get_sys_ids(db), self.cols, dates, "MS")
+        fresh[self.cols] = fresh[self.cols].astype("float")
+        if start == date.min:
+            self.months = fresh
+            return
+
+        kept = self.months[bucket(self.months) < start.year * 12 + start.month - 1]
+        self.months = pd.concat([kept, fresh], ignore_index=True).sort_values(
+            ["system_id", "year", "month"], ignore_index=True
+        )
+
+    def update(
+        self, db: Session, system_ids: List[int], first: date, last: date
+    ) -> None:
+        """Recompute the months from `first` to `last` of the systems, once built."""
+        with self.lock:
+            if self.months is None:
+                return
+
+            start = first.replace(day=1)
+            end = last.replace(day=1) + relativedelta(months=1)
+            fresh = crud.get_perfs_grouped(
+                db, system_ids, self.cols, [start, end], "MS"
+            )
+            fresh[self.cols] = fresh[self.cols].astype("float")
+
+            buckets = bucket(self.months)
+            touched = (
+                self.months["system_id"].isin(system_ids)
+                & (buckets >= start.year * 12 + start.month - 1)
+                & (buckets < end.year * 12 + end.month - 1)
+            )
+            self.months = pd.concat(
+                [self.months[~touched], fresh], ignore_index=True
+            ).sort_values(["system_id", "year", "month"], ignore_index=True)
+
+    def grouped(
+        self,
+        db: Session,
+        system_id: Union[int, List[int]],
+        dates: List[date],
+        freq: str,
+    ) -> DataFrame:
+        """Same frame as `crud.get_perfs_grouped` for month aligned ranges."""
+        with self.lock:
+            if self.months is None:
+                self._refresh(db)
+            months = self.months
+
+        keys = ["system_id"] if isinstance(system_id, list) else []
+        buckets = bucket(months)
+        mask = (buckets >= dates[0].year * 12 + dates[0].month - 1) & (
+            buckets < dates[1].year * 12 + dates[1].month - 1
+        )
+        if keys:
+            mask &= months["system_id"].isin(system_id)
+        else:
+            mask &= months["system_id"] == system_id
+        df = months[mask]
+
+        if freq == "YS":
+            return df.groupby(keys + ["year"], as_index=False)[
+                self.cols + ["days"]
+            ].sum()
+
+        return df[keys + ["year", "month"] + self.cols + ["days"]].reset_index(
+            drop=True
+        )
+
+
+def bucket(months: DataFrame) -> pd.Series:
+    return months["year"].astype("int") * 12 + months["month"].astype("int") - 1
+
+
+def aligned(dates: List[date]) -> bool:
+    """True when both ends of the range are the first instant of a month."""
+    return all(
+        d.day == 1 and (not isinstance(d, datetime) or d.time() == time())
+        for d in dates
+    )
+
+
+rollups: Dict[Tuple[str, ...], Rollup] = {}
+_rollups_lock = threading.Lock()
+
+
+def get_rollup(cols: List[str]) -> Rollup:
+    with _rollups_lock:
+        return rollups.setdefault(tuple(cols), Rollup(list(cols)))
+
+
+def grouped(
+    db: Session,
+    system_id: Union[int, List[int]],
+    cols: List[str],
+    dates: List[date],
+    freq: str,
+) -> DataFrame:
+    return get_rollup(cols).grouped(db, system_id, dates, freq)
+
+
+def update(db: Session, system_ids: List[int], first: date, last: date) -> None:
+    """Recompute the months of the systems touched by new or changed days."""
+    for rollup in list(rollups.values()):
+        rollup.update(db, system_ids, first, last)
+
+
+def refresh(db: Session, since: date = None) -> None:
+    """Recompute the touched months of every materialized column set."""
+    for rollup in list(rollups.values()):
+        rollup.refresh(db, since)
@@ -0,0 +1,126 @@
+from sqlalchemy.orm import Session
+from pandas import DataFrame
+from datetime import date
+from typing import Dict, List, Tuple
+import numpy as np
+import threading
+
+import crud
+from enums import Comparations
+
+
+class Cumulative:
+    """Prefix count, sum and sum of squares of one system and column.
+
+    Values are shifted by the first one so the sums of long histories keep
+    their precision, the variance does not depend on the shift.
+    """
+
+    def __init__(self):
+        self.dates = np.empty(0, dtype="datetime64[D]")
+        self.sums = np.zeros(1)
+        self.squares = np.zeros(1)
+        self.shift = None
+
+    def truncate(self, since: np.datetime64) -> None:
+        keep = np.searchsorted(self.dates, since)
+        self.dates = self.dates[:keep]
+        self.sums = self.sums[: keep + 1]
+        self.squares = self.squares[: keep + 1]
+
+    def extend(self, dates: np.ndarray, values: np.ndarray) -> None:
+        if not len(dates):
+            return
+        if self.shift is None:
+            self.shift = values[0]
+
+        shifted = values - self.shift
+        self.dates = np.concatenate([self.dates, dates])
+        self.sums = np.concatenate([self.sums, self.sums[-1] + np.cumsum(shifted)])
+        self.squares = np.concatenate(
+            [self.squares, self.squares[-1] + np.cumsum(shifted * shifted)]
+        )
+
+    def range(
+        self, start: np.datetime64, end: np.datetime64
+    ) -> Tuple[int, float, float]:
+        """Count, mean and population standard deviation of the days in [start, end)."""
+        lo, hi = np.searchsorted(self.dates, [start, end])
+        n = int(hi - lo)
+        if not n:
+            return 0, np.nan, np.nan
+
+        mean = (self.sums[hi] - self.sums[lo]) / n
+        var = (self.squares[hi] - self.squares[lo]) / n - mean * mean
+        return n, self.shift + mean, np.sqrt(max(var, 0.0))
+
+
+class StatsIndex:
+    """Per system cumulative statistics of daily performance columns.
+
+    Built with one scan of performances on first use, reads never query the
+    database afterwards. Days written here are re-read by `update` from
+    `ingest.invalidate`, the ones written by other workers or outside /ingest
+    when `ingest.sync` finds their month changed.
+    """
+
+    def __init__(self, cols: List[str]):
+        self.cols = cols
+        self.series: Dict[Tuple[int, str], Cumulative] = {}
+        self.systems = None
+        self.lock = threading.Lock()
+
+    def refresh(self, db: Session, since: date = None) -> None:
+        """Rebuild the index from `since` on, everything when None."""
+        with self.lock:
+            self._refresh(db, since)
+
+    def update(self, db: Session, since: date) -> None:
+        """Re-read the days from `since` on, once the index has been built."""
+        with self.lock:
+            if self.systems is not None:
+                self._refresh(db, since)
+
+    def _refresh(self, db: Session, since: date = None) -> None:
+        if since is None or self.systems is None:
+            since = None
+            self.series.clear()
+            self.systems = crud.get_sys_labels(db)
+        else:
+            for series in self.series.values():
+                series.truncate(np.datetime64(since, "D"))
+
+        df = crud.get_perfs_since(db, self.cols, since)
+        if df.empty:
+            return
+
+        for system_id, group in df.groupby("system_id"):
+            dates = group["date"].to_numpy(dtype="datetime64[D]")
+            for col in self.cols:
+                values = group[col].to_numpy(dtype="float", na_value=np.nan)
+                valid = values > 0.0
+                series = self.series.setdefault((int(system_id), col), Cumulative())
+                series.extend(dates[valid], values[valid])
+
+    def comparison(self, db: Session, col: str, dates: List[date]) -> DataFrame:
+        """Same frame as crud.get_perfs_cmp: label, technology, avg, se and days."""
+        with self.lock:
+            if self.systems is None:
+                self._refresh(db)
+
+            start = np.datetime64(dates[0], "s")
+            end = np.datetime64(dates[1], "s")
+            rows = []
+            for system in self.systems.itertuples(index=False):
+                series = self.series.get((system.system_id, col))
+                if series is None:
+                    continue
+                n, avg, std = series.range(start, end)
+                if n:
+                    se = std / np.sqrt(n) * 1.95
+                    rows.append((system.label, system.technology, avg, se, n))
+
+        return DataFrame(rows, columns=["label", "technology", "avg", "se", "days"])
+
+
+comparisons = StatsIndex([col.name for col in Comparations])
@@ -0,0 +1,75 @@
+from datetime import datetime
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+
+import pytest
+
+from benchmark import dataset
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix="pv-tests-")
+DB_PATH = os.path.join(WORKDIR, "pv.db")
+
+
+def pytest_configure(config):
+    """Point the API at the stand-in database before any module reads config.json."""
+    with open(os.path.join(ROOT, "config_sample.json")) as f:
+        settings = json.load(f)
+    settings["url"] = f"sqlite:///{DB_PATH}?check_same_thread=false"
+    for option in ["pool_size", "max_overflow", "schema_cache"]:
+        settings.pop(option, None)
+
+    path = os.path.join(WORKDIR, "config.json")
+    with open(path, "w") as f:
+        json.dump(settings, f)
+    os.environ["PV_CONFIG"] = path
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def db_path():
+    """Stand-in database of 3 systems over 5 months."""
+    dataset.generate(DB_PATH, systems=3, years=0.4, start=datetime(2021, 1, 1))
+    dataset.install()
+    return DB_PATH
+
+
+@pytest.fixture
+def db(db_path):
+    from database import SessionLocal
+
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def remove_days(db_path):
+    """Delete days of a system, returns a function inserting them back late."""
+    con = sqlite3.connect(db_path)
+    removed = []
+
+    def remove(system_id: int, first: str, last: str):
+        where = (
+            f"system_id = {system_id} AND date >= '{first}' AND date <= '{last} 23:59'"
+        )
+        removed.extend(con.execute(f"SELECT * FROM performances WHERE {where}"))
+        con.execute(f"DELETE FROM performances WHERE {where}")
+        con.commit()
+        return restore
+
+    def restore():
+        marks = ", ".join("?" * len(removed[0]))
+        con.executemany(f"INSERT OR IGNORE INTO performances VALUES ({marks})", removed)
+        con.commit()
+
+    yield remove
+    if removed:
+        restore()
+    con.close()
@@ -0,0 +1,75 @@
+"""LTTB and min-max downsampling of minute series."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import functions
+
+
+def series(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    x = np.datetime64("2021-01-01T00:00") + np.arange(n).astype("timedelta64[m]")
+    y = np.sin(np.arange(n) / 50) * 500 + rng.normal(0, 20, n)
+    return pd.DataFrame({"x": x, "y": y})
+
+
+def reference_lttb(x, y, n_out):
+    """Textbook LTTB with the same bucket edges."""
+    n = len(x)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    kept, a = [0], 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < n_out - 1:
+            nxt = slice(edges[i + 1], edges[i + 2])
+            x_avg, y_avg = x[nxt].mean(), y[nxt].mean()
+        else:
+            x_avg, y_avg = x[-1], y[-1]
+        best, best_area = lo, -1.0
+        for j in range(lo, hi):
+            area = abs((x[a] - x_avg) * (y[j] - y[a]) - (x[a] - x[j]) * (y_avg - y[a]))
+            if area > best_area:
+                best, best_area = j, area
+        kept.append(best)
+        a = best
+    kept.append(n - 1)
+    return np.array(kept)
+
+
+@pytest.mark.parametrize("n, n_out", [(1000, 100), (1440, 300), (5000, 7)])
+def test_lttb_matches_reference(n, n_out):
+    df = series(n)
+    x = np.arange(n, dtype="float")
+    y = df["y"].to_numpy()
+    np.testing.assert_array_equal(
+        functions.lttb(x, y, n_out), reference_lttb(x, y, n_out)
+    )
+
+
+def test_downsample_keeps_ends_and_order():
+    df = series(10000)
+    out = functions.downsample(df, 500, "lttb")
+    assert len(out) == 500
+    assert out["x"].iloc[0] == df["x"].iloc[0]
+    assert out["x"].iloc[-1] == df["x"].iloc[-1]
+    assert out["x"].is_monotonic_increasing
+    assert functions.downsample(df, 20000, "lttb") is df
+
+
+def test_min_max_keeps_bucket_extremes():
+    df = series(1000)
+    y = df["y"].to_numpy()
+    idx = functions.min_max(y, 100)
+    assert (np.diff(idx) > 0).all()
+
+    buckets = np.arange(1000) * 50 // 1000
+    for bucket in range(50):
+        values = y[buckets == bucket]
+        kept = y[idx][buckets[idx] == bucket]
+        assert values.min() in kept and values.max() in kept
+
+
+def test_min_max_skips_nan():
+    y = np.array([np.nan, 1.0, 5.0, np.nan, 2.0, 3.0])
+    idx = functions.min_max(y, 2)
+    assert set(y[idx]) == {1.0, 5.0}
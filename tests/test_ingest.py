@@ -0,0 +1,47 @@
+"""Bulk ingest read back through the endpoints."""
+import sqlite3
+
+from fastapi.testclient import TestClient
+import pytest
+
+from database import get_config
+
+TOKEN = "secret"
+
+
+@pytest.fixture
+def client(db_path, monkeypatch):
+    import main
+
+    monkeypatch.setitem(get_config(), "ingest_token", TOKEN)
+    yield TestClient(main.app)
+
+    con = sqlite3.connect(db_path)
+    con.execute("DELETE FROM performances WHERE date >= '2021-06'")
+    con.commit()
+    con.close()
+
+
+def post(client, table: str, body: str):
+    headers = {"Content-Type": "text/csv", "X-Ingest-Token": TOKEN}
+    return client.post(f"/ingest/{table}", data=body, headers=headers)
+
+
+def test_ingested_days_read_back(client):
+    body = (
+        "system_id,date,yield_final,yield_reference\n"
+        "1,2021-06-01,4.1,5.0\n"
+        "1,2021-06-02,4.2,5.1\n"
+    )
+    rslt = post(client, "performances", body).json()
+    assert rslt["inserted"] == 2
+
+    daily = client.get("/yield/array/1/2021-06-01?end_dt=2021-06-02").json()
+    assert daily["x"] == ["2021-06-01T00:00:00", "2021-06-02T00:00:00"]
+    assert daily["y"] == [4.1, 4.2]
+
+    monthly = client.get("/yield/array/1/2021-06?agg=month").json()
+    assert monthly["text"] == ["days: 2"]
+
+    rslt = post(client, "performances", body).json()
+    assert (rslt["inserted"], rslt["duplicates"]) == (0, 2)
@@ -0,0 +1,61 @@
+"""Keyset pages of the minute series."""
+import sqlite3
+
+from fastapi.testclient import TestClient
+import pytest
+
+
+@pytest.fixture
+def client(db_path):
+    import main
+
+    return TestClient(main.app)
+
+
+def pages(client, path: str):
+    while path is not None:
+        page = client.get(path).json()
+        yield page
+        path = page["next"] and f"{path.split('&after=')[0]}&after={page['next']}"
+
+
+def test_pages_join_up_to_the_series(client):
+    path = "/ambient/t_mod/1/2021-03-01?end_dt=2021-03-02"
+    series = client.get(path).json()
+    x, y = [], []
+    for page in pages(client, f"{path}&limit=700"):
+        assert len(page["x"]) <= 700
+        x += page["x"]
+        y += page["y"]
+    assert (x, y) == (series["x"], series["y"])
+
+
+def test_page_revalidates_without_the_range(client):
+    path = "/ambient/t_mod/1/2021-03-01?end_dt=2021-03-31&limit=100"
+    response = client.get(path)
+    etag = response.headers["ETag"]
+    assert client.get(path, headers={"If-None-Match": etag}).status_code == 304
+
+    following = f"{path}&after={response.json()['next']}"
+    assert client.get(following).headers["ETag"] != etag
+
+
+def test_limit_filled_by_one_datetime_is_rejected(client, db_path):
+    # A duplicated observation holds a second temperature at 2021-03-01 00:05
+    con = sqlite3.connect(db_path)
+    (stamp,) = con.execute(
+        "SELECT datetime FROM observations WHERE datetime LIKE '2021-03-01 00:05%'"
+    ).fetchone()
+    con.execute("INSERT INTO observations VALUES (-1, ?)", (stamp,))
+    con.execute("INSERT INTO t_mods VALUES (-1, 1, 99.0)")
+    con.commit()
+    try:
+        path = "/ambient/t_mod/1/2021-03-01?limit=1&after=2021-03-01T00:04:00"
+        assert client.get(path).status_code == 422
+        page = client.get(path.replace("limit=1", "limit=2")).json()
+        assert page["x"] == ["2021-03-01T00:05:00"] * 2
+    finally:
+        con.execute("DELETE FROM t_mods WHERE observation_id = -1")
+        con.execute("DELETE FROM observations WHERE observation_id = -1")
+        con.commit()
+        con.close()
@@ -0,0 +1,57 @@
+"""Interval and stat resampling of minute series."""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import crud
+import functions
+
+
+def series(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    x = np.datetime64("2021-01-01T00:00") + np.arange(n).astype("timedelta64[m]")
+    y = np.sin(np.arange(n) / 50) * 500 + rng.normal(0, 20, n)
+    return pd.DataFrame({"x": x, "y": y})
+
+
+@pytest.mark.parametrize("freq, rule", [("T5", "5min"), ("T15", "15min"), ("H", "1H")])
+@pytest.mark.parametrize("stat", ["mean", "min", "max"])
+def test_resample_matches_pandas(freq, rule, stat):
+    df = series(3000)
+    df.loc[df.index % 7 == 0, "y"] = np.nan
+    df = df.drop(index=range(100, 400))
+
+    got = functions.resample(df, freq, stat)
+    expected = getattr(df.set_index("x")["y"].resample(rule), stat)()
+    expected = expected[df.set_index("x")["y"].resample(rule).size() > 0]
+    np.testing.assert_array_equal(
+        got["x"].to_numpy(dtype="datetime64[s]"),
+        expected.index.to_numpy(dtype="datetime64[s]"),
+    )
+    np.testing.assert_allclose(got["y"], expected.to_numpy(), rtol=1e-12)
+
+
+def test_resample_min_max_columns():
+    df = series(600)
+    got = functions.resample(df, "H", "min-max")
+    assert list(got.columns) == ["x", "y_min", "y_max"]
+    assert (got["y_min"] <= got["y_max"]).all()
+
+
+@pytest.mark.parametrize("freq", ["T5", "H"])
+@pytest.mark.parametrize("stat", ["mean", "min", "max", "min-max"])
+def test_sql_resample_matches_numpy(db, freq, stat):
+    dates = [date(2021, 3, 1), date(2021, 3, 2)]
+    col, key_id, build = crud.temps_series(1)
+    got = crud.resampled_frame(db, build(dates), freq, stat, ["y"])
+    expected = functions.resample(crud.series_frame(db, build(dates)), freq, stat)
+    assert list(got.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(got, expected, rtol=1e-12)
+
+    got = crud.get_timeline(db, 1, dates, freq, stat)
+    timeline = crud.fetch(db, crud.timeline_stmt(1, dates))
+    timeline.rename({"datetime": "x"}, axis=1, inplace=True)
+    expected = functions.resample(timeline, freq, stat)
+    pd.testing.assert_frame_equal(got, expected, rtol=1e-12)
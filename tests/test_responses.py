@@ -0,0 +1,51 @@
+"""Compact time axis of the compact JSON format and negotiated formats."""
+from fastapi.testclient import TestClient
+import numpy as np
+
+import responses
+
+
+def test_compact_axis_regular_with_gaps():
+    x = np.datetime64("2021-01-01T00:00:00") + np.array(
+        [0, 60, 120, 300, 360, 600], dtype="timedelta64[s]"
+    )
+    axis = responses.compact_axis(x)
+    assert axis["start"] == "2021-01-01T00:00:00"
+    assert axis["step"] == 60
+    assert axis["count"] == 11
+    assert axis["gaps"].tolist() == [[3, 2], [7, 3]]
+
+    # The slots outside the gaps are exactly the points
+    slots = np.arange(axis["count"])
+    for slot, length in axis["gaps"]:
+        slots = slots[(slots < slot) | (slots >= slot + length)]
+    expected = (x - x[0]).astype("int64") // axis["step"]
+    np.testing.assert_array_equal(slots, expected)
+
+
+def test_compact_axis_irregular():
+    x = np.datetime64("2021-01-01T00:00:00") + np.array(
+        [0, 60, 150], dtype="timedelta64[s]"
+    )
+    assert responses.compact_axis(x) is None
+    assert responses.compact_axis(x[:1]) is None
+
+
+def test_comparison_and_systems_negotiate(db_path):
+    import main
+
+    client = TestClient(main.app)
+    headers = {"Accept": responses.COMPACT}
+    rslt = client.get("/comparison/array-yield/2021-01-01/2021-03-01/", headers=headers)
+    assert rslt.headers["content-type"] == responses.COMPACT
+    assert list(rslt.json()) == ["label", "technology", "avg", "se", "days"]
+
+    rslt = client.get("/comparison/array-yield/2021-01-01/2021-03-01/")
+    assert set(rslt.json()["PUCP"]) == {"techs", "avg", "se", "days"}
+
+    headers = {"Accept": responses.PACKED}
+    rslt = client.get(
+        "/systems/array-yield/2021-03-01?end_dt=2021-03-02", headers=headers
+    )
+    assert rslt.headers["x-columns"] == "system_id,x,y"
+    assert rslt.headers["x-count"] == "6"
@@ -0,0 +1,59 @@
+"""The in-process comparison index against the SQL aggregation."""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import crud
+import ingest
+import stats
+from enums import Comparations
+
+COLS = [col.name for col in Comparations]
+
+
+def random_ranges(count: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    first = np.datetime64("2020-12-20")
+    for _ in range(count):
+        start, length = rng.integers(0, 160), rng.integers(1, 60)
+        yield [
+            (first + start).astype(datetime),
+            (first + start + length).astype(datetime),
+        ]
+
+
+def assert_comparison(index: stats.StatsIndex, db, col: str, dates) -> None:
+    keys = ["label", "technology"]
+    got = index.comparison(db, col, dates).sort_values(keys, ignore_index=True)
+    expected = crud.get_perfs_cmp(db, col, dates).sort_values(keys, ignore_index=True)
+    # Constant columns have a standard deviation of 0 up to rounding
+    pd.testing.assert_frame_equal(
+        got, expected, check_dtype=False, check_index_type=False, rtol=1e-9, atol=1e-6
+    )
+
+
+def test_comparison_index_matches_sql(db):
+    index = stats.StatsIndex(COLS)
+    for i, dates in enumerate(random_ranges(60)):
+        assert_comparison(index, db, COLS[i % len(COLS)], dates)
+
+
+def test_comparison_index_reads_without_database(db):
+    index = stats.StatsIndex(COLS)
+    index.refresh(db)
+    dates = [datetime(2021, 2, 1), datetime(2021, 3, 1)]
+    assert len(index.comparison(None, "yield_final", dates)) == 3
+
+
+def test_sync_picks_up_late_days(db, remove_days):
+    # System 2 lags the others by 4 days, then they are written by another worker
+    restore = remove_days(2, "2021-05-23", "2021-05-26")
+    ingest.sync(db)
+    stats.comparisons.refresh(db)
+    dates = [datetime(2021, 4, 1), datetime(2021, 6, 1)]
+    assert_comparison(stats.comparisons, db, "yield_final", dates)
+
+    restore()
+    ingest.sync(db)
+    assert_comparison(stats.comparisons, db, "yield_final", dates)
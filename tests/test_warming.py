@@ -0,0 +1,16 @@
+"""Paths requested by the cache warmer."""
+import cache
+import functions
+import warming
+
+
+def test_comparison_paths_stay_cached():
+    paths = warming.expand(warming.DEFAULT_PATHS, [1], 30)
+    paths = [path for path in paths if path.startswith("/comparison/")]
+    assert paths
+
+    for path in paths:
+        start_dt, end_dt = path.strip("/").split("/")[-2:]
+        dates = functions.format_dates(start_dt, end_dt)
+        dates = functions.set_dates_range(functions.sort_dates(dates))
+        assert cache.is_historical(dates)
@@ -0,0 +1,181 @@
+"""Scheduled in-process requests that fill the response cache before visitors do."""
+import asyncio
+from datetime import date, datetime, timedelta
+import logging
+from typing import Callable, Iterable, List, Set
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Landing page views, {sys_id} is repeated for every system
+DEFAULT_PATHS = [
+    "/yield/reference/{sys_id}/{start}?end_dt={end}",
+    "/yield/array/{sys_id}/{start}?end_dt={end}",
+    "/yield/system/{sys_id}/{start}?end_dt={end}",
+    "/performance-ratio/dc/{sys_id}/{start}?end_dt={end}",
+    "/performance-ratio/ac/{sys_id}/{start}?end_dt={end}",
+    "/energy/dc/{sys_id}/{start}?end_dt={end}",
+    "/energy/ac/{sys_id}/{start}?end_dt={end}",
+    "/comparison/reference-yield/{month}/{end}/",
+    "/comparison/array-yield/{month}/{end}/",
+    "/comparison/system-yield/{month}/{end}/",
+    "/comparison/performance-ratio/{month}/{end}/",
+    "/comparison/dc-energy/{month}/{end}/",
+    "/comparison/ac-energy/{month}/{end}/",
+]
+
+requests = metrics.Counter(
+    "pv_warm_requests_total", "Requests sent by the cache warmer.", ("status",)
+)
+
+
+class Cron:
+    """Minute, hour, day of month, month and day of week fields of a crontab
+    line, each `*`, `*/n`, `a`, `a-b` or `a-b/n`, comma separated.
+    """
+
+    RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+
+    def __init__(self, expr: str):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"Expected 5 cron fields: {expr!r}")
+        self.minutes, self.hours, self.days, self.months, self.weekdays = [
+            self.parse(field, *bounds) for field, bounds in zip(fields, self.RANGES)
+        ]
+
+    @staticmethod
+    def parse(field: str, lo: int, hi: int) -> Set[int]:
+        values = set()
+        for part in field.split(","):
+            span, _, step = part.partition("/")
+            if span == "*":
+                first, last = lo, hi
+            elif "-" in span:
+                first, last = [int(value) for value in span.split("-")]
+            else:
+                first = last = int(span)
+            if not lo <= first <= last <= hi:
+                raise ValueError(f"Cron field out of range: {field!r}")
+            values.update(range(first, last + 1, int(step or 1)))
+        return values
+
+    def matches_day(self, moment: datetime) -> bool:
+        # Crontab weekdays start on Sunday
+        return (
+            moment.month in self.months
+            and moment.day in self.days
+            and (moment.weekday() + 1) % 7 in self.weekdays
+        )
+
+    def next(self, after: datetime) -> datetime:
+        """First matching minute after `after`."""
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 4)
+        while moment < limit:
+            if not self.matches_day(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+
+        raise ValueError("Cron expression never matches")
+
+
+def expand(templates: Iterable[str], system_ids: List[int], days: int) -> List[str]:
+    """Paths of the views for the `days` before today and the month up to yesterday.
+
+    Ranges ending yesterday are historical, the cache keeps them until the
+    next load instead of `cache_ttl` seconds.
+    """
+    today = date.today()
+    end = today - timedelta(days=1)
+    values = {
+        "start": (end - timedelta(days=days - 1)).isoformat(),
+        "end": end.isoformat(),
+        "month": end.replace(day=1).isoformat(),
+        "today": today.isoformat(),
+    }
+
+    paths = []
+    for template in templates:
+        if "{sys_id}" in template:
+            paths += [template.format(sys_id=sys_id, **values) for sys_id in system_ids]
+        else:
+            paths.append(template.format(**values))
+    return paths
+
+
+async def get(app: Callable, path: str) -> int:
+    """Send a GET through the ASGI app and discard the body, returns the status."""
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "server": ("warmer", 80),
+        "client": ("127.0.0.1", 0),
+        "root_path": "",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "headers": [(b"host", b"warmer")],
+    }
+    status = 500
+    received = asyncio.Event()
+
+    async def receive() -> dict:
+        if received.is_set():
+            # Streaming responses keep listening for a disconnect
+            await asyncio.Event().wait()
+        received.set()
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: dict) -> None:
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def warm(app: Callable, paths: List[str], concurrency: int) -> int:
+    """Request the paths at most `concurrency` at a time, returns the failures."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(path: str) -> bool:
+        async with semaphore:
+            try:
+                status = await get(app, path)
+            except Exception:
+                logger.exception("Warming %s failed", path)
+                status = 500
+        requests.inc(1, str(status))
+        return status < 400
+
+    done = await asyncio.gather(*[one(path) for path in paths])
+    return done.count(False)
+
+
+async def run_forever(cron: Cron, job: Callable, on_start: bool = True) -> None:
+    """Await `job()` at start and at every time matching the schedule."""
+    if on_start:
+        await run_logged(job)
+    while True:
+        now = datetime.now()
+        await asyncio.sleep((cron.next(now) - now).total_seconds())
+        await run_logged(job)
+
+
+async def run_logged(job: Callable) -> None:
+    try:
+        await job()
+    except Exception:
+        logger.exception("Scheduled %s failed", getattr(job, "__name__", "job"))